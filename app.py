@@ -1,27 +1,20 @@
+import time
 import streamlit as st
-import numpy as np
-from PIL import Image
-from model_utils import load_model, preprocess_image, predict_disease
-from disease_info import get_disease_info
-from chat_utils import get_plant_expert_response, analyze_symptoms_for_diseases
-from weather_utils import get_weather_recommendations, get_seasonal_tips
-from plant_tracker import init_plant_tracker, add_plant, log_plant_activity, get_plant_care_schedule, export_plant_data
-from plant_encyclopedia import search_plant_info, get_plant_info, get_all_plants, get_plants_by_difficulty
-from auth_utils import init_auth, register_user, login_user, logout_user, load_user_plants, save_user_plants, get_user_profile
-from social_features import get_community_stats, get_farmer_insights, get_disease_alerts, get_success_stories, log_disease_detection, get_regional_tips
-from database import init_database, get_plant_images, get_success_stories as get_db_success_stories, log_disease_detection_db, get_community_disease_stats
-import io
+from instrumentation import INSTRUMENTATION_ENABLED, REGISTRY, METRICS_FILE, timed, timer
+from auth_utils import init_auth, register_user, login_user, logout_user, load_user_plants, is_admin
+from database import init_database
+from dashboard_cache import cached_plant_images, cached_user_profile
+from image_store import gallery_image
 
-# Configure page
-st.set_page_config(
-    page_title="Plant Disease Detector",
-    page_icon="🌱",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Tab modules, and the heavy dependencies behind them (pandas, PIL, the model,
+# google-genai), are imported inside the functions that use them, so the login
+# page renders without loading any of them. See import_profile.py.
+
+# Most overdue care tasks listed in the tracker tab
+CARE_SCHEDULE_DISPLAY_LIMIT = 20
 
 # Custom CSS for better styling
-st.markdown("""
+PAGE_STYLE = """
 <style>
     .main-header {
         text-align: center;
@@ -91,25 +84,44 @@ st.markdown("""
         font-size: 1.1em;
     }
 </style>
-""", unsafe_allow_html=True)
-
-# Initialize session state
-if 'model' not in st.session_state:
-    st.session_state.model = None
-    st.session_state.model_loaded = False
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+"""
 
-# Initialize database, authentication and plant tracker
-init_database()
-init_auth()
-init_plant_tracker()
+def init_app():
+    """Page setup, session defaults, database and auth; runs at the start of every rerun
+    
+    Kept out of module level so that importing this module (as image worker
+    processes do with the main module) has no Streamlit side effects.
+    """
+    st.set_page_config(
+        page_title="Plant Disease Detector",
+        page_icon="🌱",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
+    
+    # Initialize session state
+    if 'model' not in st.session_state:
+        st.session_state.model = None
+        st.session_state.model_loaded = False
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []
+    
+    # Initialize database and authentication
+    with timer("app.init"):
+        init_database()
+        init_auth()
 
-# Load user-specific data if authenticated
-if st.session_state.authenticated and st.session_state.username:
-    plants, logs = load_user_plants(st.session_state.username)
-    st.session_state.plants = plants
-    st.session_state.plant_logs = logs
+@timed("app.load_session_plants")
+def load_session_plants():
+    """Initialize the plant tracker and load the user's data once per login; later changes are kept in session state"""
+    from plant_tracker import init_plant_tracker, set_tracked_plants
+    
+    init_plant_tracker()
+    if st.session_state.get('plants_loaded_for') != st.session_state.username:
+        plants, logs = load_user_plants(st.session_state.username)
+        set_tracked_plants(plants, logs)
+        st.session_state.plants_loaded_for = st.session_state.username
 
 def main():
     # Check authentication
@@ -117,6 +129,8 @@ def main():
         show_auth_page()
         return
     
+    load_session_plants()
+    
     # Main header with styling
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -128,7 +142,7 @@ def main():
         """, unsafe_allow_html=True)
     
     with col2:
-        user_profile = get_user_profile(st.session_state.username)
+        user_profile = cached_user_profile(st.session_state.username)
         st.markdown(f"""
         <div style="background: #f0f0f0; padding: 1rem; border-radius: 10px; text-align: center; margin-top: 1rem;">
             <strong>Welcome, {st.session_state.username}!</strong><br>
@@ -184,6 +198,15 @@ def main():
         with tab5:
             care_dashboard_tab()
 
+def show_gallery_image(image_url, caption, size="medium"):
+    """Render a reference image from the local thumbnail store"""
+    source = gallery_image(image_url, size)
+    if source:
+        st.image(source, caption=caption, use_container_width=True)
+    else:
+        st.caption(f"🖼️ {caption} (image not available offline)")
+
+@timed("app.show_auth_page")
 def show_auth_page():
     """Show login/register page"""
     st.markdown("""
@@ -195,13 +218,13 @@ def show_auth_page():
     
     # Show sample plant images in a gallery
     st.markdown("### Featured Plant Health Examples")
-    healthy_images = get_plant_images(category="healthy")[:4]
+    healthy_images = cached_plant_images(category="healthy")[:4]
     
     if healthy_images:
         cols = st.columns(4)
         for i, img in enumerate(healthy_images):
             with cols[i]:
-                st.image(img["image_url"], caption=f"Healthy {img['plant_name']}", use_container_width=True)
+                show_gallery_image(img["image_url"], f"Healthy {img['plant_name']}", size="small")
     
     col1, col2, col3 = st.columns([1, 2, 1])
     
@@ -264,12 +287,14 @@ def show_register_form():
             else:
                 st.error("Please fill in required fields (marked with *)")
 
+@timed("app.farmer_dashboard_tab")
 def farmer_dashboard_tab():
     """Special dashboard for farmers"""
+    from dashboard_cache import cached_disease_stats, cached_regional_tips, cached_success_stories
     st.markdown("### 🌾 Farmer Dashboard")
     
     # Community stats from database
-    disease_stats = get_community_disease_stats()
+    disease_stats = cached_disease_stats()
     
     st.markdown("#### Community Disease Tracking")
     if disease_stats:
@@ -299,35 +324,35 @@ def farmer_dashboard_tab():
     tab1, tab2 = st.tabs(["Healthy Plants", "Disease Examples"])
     
     with tab1:
-        healthy_images = get_plant_images(category="healthy")
+        healthy_images = cached_plant_images(category="healthy")
         if healthy_images:
             cols = st.columns(3)
             for i, img in enumerate(healthy_images[:6]):
                 with cols[i % 3]:
-                    st.image(img["image_url"], caption=f"{img['plant_name']}", use_container_width=True)
+                    show_gallery_image(img["image_url"], f"{img['plant_name']}")
                     st.caption(img["description"])
     
     with tab2:
-        diseased_images = get_plant_images(category="diseased")
+        diseased_images = cached_plant_images(category="diseased")
         if diseased_images:
             cols = st.columns(3)
             for i, img in enumerate(diseased_images[:6]):
                 with cols[i % 3]:
-                    st.image(img["image_url"], caption=f"{img['plant_name']} - {img['disease_name']}", use_container_width=True)
+                    show_gallery_image(img["image_url"], f"{img['plant_name']} - {img['disease_name']}")
                     st.caption(img["description"])
     
     # Regional tips
-    user_profile = get_user_profile(st.session_state.username)
+    user_profile = cached_user_profile(st.session_state.username)
     user_location = user_profile.get('location', '')
     if user_location:
         st.markdown("#### Regional Agricultural Tips")
-        regional_tips = get_regional_tips(user_location)
+        regional_tips = cached_regional_tips(user_location)
         for tip in regional_tips:
             st.write(f"• {tip}")
     
     # Success stories from database
     st.markdown("#### Success Stories from Our Community")
-    stories = get_db_success_stories()
+    stories = cached_success_stories()
     
     if stories:
         cols = st.columns(min(len(stories), 3))
@@ -342,15 +367,20 @@ def farmer_dashboard_tab():
                 </div>
                 """, unsafe_allow_html=True)
 
+@timed("app.image_analysis_tab")
 def image_analysis_tab():
     """Tab for image-based disease detection"""
+    from PIL import Image
+    from inference_scheduler import load_serving_model
+    from image_workers import warm_image_workers
     st.markdown("### Upload a leaf image to get instant disease analysis and treatment recommendations")
     
     # Load model
     if not st.session_state.model_loaded:
         with st.spinner("Loading AI model... This may take a moment."):
             try:
-                st.session_state.model = load_model()
+                st.session_state.model = load_serving_model()
+                warm_image_workers()
                 st.session_state.model_loaded = True
                 st.success("AI model loaded successfully!")
             except Exception as e:
@@ -387,10 +417,16 @@ def image_analysis_tab():
                 with col_info2:
                     st.metric("File Size", f"{len(uploaded_file.getvalue())/1024:.1f} KB")
                 
+                from lesion_scan import should_scan
+                high_resolution = should_scan(image) and st.checkbox(
+                    "🔎 High-resolution lesion scan",
+                    help="Analyze the full-size photo tile by tile to catch small lesions (slower)"
+                )
+                
                 # Analyze button with custom styling
                 st.markdown("<br>", unsafe_allow_html=True)
                 if st.button("🔍 Analyze for Diseases", type="primary", use_container_width=True):
-                    analyze_image(image, col2)
+                    analyze_image(image, col2, high_resolution=high_resolution, image_data=uploaded_file.getvalue())
                     
             except Exception as e:
                 st.error(f"Error loading image: {str(e)}")
@@ -414,8 +450,10 @@ def image_analysis_tab():
             </div>
             """, unsafe_allow_html=True)
 
+@timed("app.ai_chat_tab")
 def ai_chat_tab():
     """Tab for AI-powered plant expert chat"""
+    from chat_utils import get_plant_expert_response
     st.markdown("### 💬 Describe your plant's symptoms and get expert advice")
     
     # Check API status and show appropriate message
@@ -530,8 +568,16 @@ def ai_chat_tab():
                 st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
             st.rerun()
 
-def analyze_image(image, result_column):
-    """Analyze the uploaded image for plant diseases"""
+@timed("app.analyze_image")
+def analyze_image(image, result_column, high_resolution=False, image_data=None):
+    """Analyze the uploaded image for plant diseases
+    
+    With high_resolution, the full-size photo is scanned in tiles instead.
+    `image_data` (the uploaded file's bytes) lets decoding and segmentation
+    run in the image worker processes.
+    """
+    from model_utils import preprocess_image, predict_disease, segment_leaf, mask_overlay
+    from image_workers import preprocess_upload
     
     with result_column:
         st.markdown("### 🔬 Analysis Results")
@@ -541,17 +587,41 @@ def analyze_image(image, result_column):
         status_text = st.empty()
         
         try:
-            # Step 1: Preprocessing
-            status_text.text("🔄 Preprocessing image...")
+            if high_resolution:
+                from lesion_scan import scan_image
+                status_text.text("🔎 Scanning the photo tile by tile...")
+                progress_bar.progress(50)
+                scan = scan_image(st.session_state.model, image)
+                progress_bar.empty()
+                status_text.empty()
+                predictions = scan["predictions"]
+                display_results(predictions)
+                
+                with st.expander("🗺️ Lesion heatmap", expanded=True):
+                    st.image(
+                        scan["heatmap"],
+                        caption=f"Red areas scored as diseased ({scan['tiles']} tiles at {scan['scan_size'][0]}×{scan['scan_size'][1]})",
+                        use_container_width=True
+                    )
+                log_detection(predictions)
+                return
+            
+            # Steps 1-2: Preprocessing and separating the leaf from the background
+            status_text.text("🔄 Preprocessing image and finding the leaf...")
             progress_bar.progress(25)
-            processed_image = preprocess_image(image)
+            input_size = st.session_state.model.input_size
+            if image_data is not None:
+                processed_image, masks = preprocess_upload(image_data, input_size)
+            else:
+                processed_image = preprocess_image(image, input_size)
+                masks = segment_leaf(processed_image)
             
-            # Step 2: Analysis
+            # Step 3: Analysis
             status_text.text("🧠 Analyzing with AI model...")
             progress_bar.progress(75)
-            predictions = predict_disease(st.session_state.model, processed_image)
+            predictions = predict_disease(st.session_state.model, processed_image, masks=masks)
             
-            # Step 3: Results
+            # Step 4: Results
             status_text.text("✅ Analysis complete!")
             progress_bar.progress(100)
             
@@ -562,26 +632,39 @@ def analyze_image(image, result_column):
             # Display results
             display_results(predictions)
             
-            # Log disease detection for authenticated users
-            if st.session_state.authenticated:
-                top_disease = max(predictions.items(), key=lambda x: x[1])
-                if top_disease[1] > 0.3 and "healthy" not in top_disease[0].lower():
-                    user_profile = get_user_profile(st.session_state.username)
-                    log_disease_detection_db(
-                        st.session_state.user_id,
-                        "Uploaded Image",
-                        top_disease[0], 
-                        top_disease[1],
-                        user_profile.get('location', '')
-                    )
+            with st.expander("🍃 Leaf area used for analysis"):
+                st.image(
+                    mask_overlay(processed_image[0], masks[0]),
+                    caption=f"Background is tinted; leaf covers {masks[0].mean():.0%} of the frame",
+                    use_container_width=True
+                )
+            
+            log_detection(predictions)
             
         except Exception as e:
             progress_bar.empty()
             status_text.empty()
             st.error(f"Error during analysis: {str(e)}")
 
+def log_detection(predictions):
+    """Log the top disease prediction for authenticated users"""
+    from dashboard_cache import record_disease_detection
+    
+    if st.session_state.authenticated:
+        top_disease = max(predictions.items(), key=lambda x: x[1])
+        if top_disease[1] > 0.3 and "healthy" not in top_disease[0].lower():
+            user_profile = cached_user_profile(st.session_state.username)
+            record_disease_detection(
+                st.session_state.user_id,
+                "Uploaded Image",
+                top_disease[0], 
+                top_disease[1],
+                user_profile.get('location', '')
+            )
+
 def display_results(predictions):
     """Display the disease prediction results"""
+    from disease_info import get_disease_info
     
     # Get top predictions
     top_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -777,8 +860,10 @@ def display_sidebar():
     </div>
     """, unsafe_allow_html=True)
 
+@timed("app.plant_encyclopedia_tab")
 def plant_encyclopedia_tab():
     """Tab for plant care encyclopedia"""
+    from plant_encyclopedia import search_plant_info, get_plant_info, get_all_plants
     st.markdown("### 🌿 Plant Care Encyclopedia")
     st.markdown("Search for detailed care information about different plants")
     
@@ -802,12 +887,12 @@ def plant_encyclopedia_tab():
     else:
         # Show plant image gallery first
         st.markdown("#### Featured Plants")
-        plant_images = get_plant_images(category="healthy")
+        plant_images = cached_plant_images(category="healthy")
         if plant_images:
             cols = st.columns(4)
             for i, img in enumerate(plant_images[:8]):
                 with cols[i % 4]:
-                    st.image(img["image_url"], caption=img["plant_name"], use_container_width=True)
+                    show_gallery_image(img["image_url"], img["plant_name"], size="small")
         
         # Show all plants in a grid
         st.markdown("#### Browse All Plants")
@@ -824,14 +909,14 @@ def display_plant_card_with_images(plant_name, info):
     """Display a plant information card with images"""
     with st.expander(f"🌱 {plant_name} ({info['scientific_name']})"):
         # Get plant images
-        plant_images = get_plant_images(plant_name=plant_name)
+        plant_images = cached_plant_images(plant_name=plant_name)
         
         if plant_images:
             st.markdown("**Plant Examples:**")
             img_cols = st.columns(min(len(plant_images), 3))
             for i, img in enumerate(plant_images[:3]):
                 with img_cols[i]:
-                    st.image(img["image_url"], caption=f"{img['disease_name'] or 'Healthy'}", use_container_width=True)
+                    show_gallery_image(img["image_url"], f"{img['disease_name'] or 'Healthy'}")
         
         col1, col2 = st.columns(2)
         
@@ -862,8 +947,16 @@ def display_plant_card(plant_name, info):
     """Display a simple plant information card"""
     display_plant_card_with_images(plant_name, info)
 
+@timed("app.plant_tracker_tab")
+@st.fragment
 def plant_tracker_tab():
-    """Tab for personal plant tracking"""
+    """Tab for personal plant tracking
+    
+    Runs as a fragment: widget interactions in the tab rerun only the tab.
+    Actions that change the plant data still rerun the whole app, since the
+    care dashboard shows the same data.
+    """
+    from plant_tracker import get_plant_list, add_plant, log_plant_activity, get_plant_care_schedule, persist_plant
     st.markdown("### 📊 My Plant Collection")
     
     # Add new plant section
@@ -880,20 +973,22 @@ def plant_tracker_tab():
         
         if st.button("Add Plant", type="primary"):
             if plant_name and species:
-                add_plant(plant_name, species, location, health_status, notes)
+                plant = add_plant(plant_name, species, location, health_status, notes)
                 # Save to user's account
                 if st.session_state.authenticated:
-                    save_user_plants(st.session_state.username, st.session_state.plants, st.session_state.plant_logs)
+                    persist_plant(st.session_state.username, plant, new=True)
                 st.success(f"Added {plant_name} to your collection!")
                 st.rerun()
             else:
                 st.error("Please fill in plant name and species")
     
+    plant_data_transfer_section()
+    
     # Display existing plants
     if st.session_state.plants:
         st.markdown("#### Your Plants")
         
-        for plant in st.session_state.plants:
+        for plant in get_plant_list():
             with st.container():
                 st.markdown(f"""
                 <div style="background: #f8f9fa; padding: 1rem; border-radius: 10px; margin: 0.5rem 0; border-left: 4px solid #4CAF50;">
@@ -924,17 +1019,17 @@ def plant_tracker_tab():
                     log_col1, log_col2 = st.columns(2)
                     with log_col1:
                         if st.button("Save Activity", key=f"save_{plant['id']}"):
-                            log_plant_activity(plant['id'], activity, activity_notes)
+                            log_entry = log_plant_activity(plant['id'], activity, activity_notes)
                             # Save to user's account
                             if st.session_state.authenticated:
-                                save_user_plants(st.session_state.username, st.session_state.plants, st.session_state.plant_logs)
+                                persist_plant(st.session_state.username, plant, log_entry)
                             st.session_state[f"show_log_{plant['id']}"] = False
                             st.success("Activity logged!")
                             st.rerun()
                     with log_col2:
                         if st.button("Cancel", key=f"cancel_{plant['id']}"):
                             st.session_state[f"show_log_{plant['id']}"] = False
-                            st.rerun()
+                            st.rerun(scope="fragment")
                 
                 if plant['notes']:
                     st.markdown(f"**Notes:** {plant['notes']}")
@@ -942,7 +1037,7 @@ def plant_tracker_tab():
                 st.markdown("---")
         
         # Care schedule
-        schedule = get_plant_care_schedule()
+        schedule = get_plant_care_schedule(top_n=CARE_SCHEDULE_DISPLAY_LIMIT)
         if schedule:
             st.markdown("#### 📅 Care Schedule")
             for task in schedule:
@@ -955,13 +1050,54 @@ def plant_tracker_tab():
     else:
         st.info("No plants in your collection yet. Add your first plant above!")
 
+def plant_data_transfer_section():
+    """Export and import of plant data in streaming formats"""
+    from plant_tracker import plant_export_bytes, import_plant_data_stream, persist_all_plants
+    from plant_io import EXPORT_FORMATS, export_filename
+    with st.expander("📦 Export / Import Plant Data"):
+        fmt = st.radio("Format", list(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f]["label"], horizontal=True)
+        compress = st.checkbox("Compress (gzip)")
+        
+        if st.session_state.plants:
+            # Built on request rather than on every rerun; dropped once the format or the data changes
+            options = (fmt, compress, len(st.session_state.plants), len(st.session_state.plant_logs))
+            export = st.session_state.get("plant_export")
+            if export is not None and export["options"] != options:
+                export = st.session_state.plant_export = None
+            if export is None and st.button("📦 Prepare Export"):
+                export = st.session_state.plant_export = {"options": options, "data": plant_export_bytes(fmt, compress)}
+            if export is not None:
+                st.download_button(
+                    "⬇️ Download Export",
+                    data=export["data"],
+                    file_name=export_filename(fmt, compress),
+                    mime="application/gzip" if compress else EXPORT_FORMATS[fmt]["mime"]
+                )
+        
+        uploaded_export = st.file_uploader("Import from an export file", type=["jsonl", "csv", "gz"], key="plant_import_file")
+        if uploaded_export is not None and st.button("Import (replaces current plants)"):
+            import_format = "csv" if ".csv" in uploaded_export.name else "jsonl"
+            success, errors = import_plant_data_stream(uploaded_export, import_format)
+            if success:
+                if st.session_state.authenticated:
+                    persist_all_plants(st.session_state.username)
+                st.success(f"Imported {len(st.session_state.plants)} plants and {len(st.session_state.plant_logs)} log entries")
+            else:
+                st.error("Import failed")
+            for error in errors:
+                st.warning(error)
+
+@timed("app.care_dashboard_tab")
 def care_dashboard_tab():
     """Tab for weather and seasonal care dashboard"""
+    from plant_tracker import get_plant_list, get_upcoming_care_tasks
+    from weather_utils import get_weather_recommendations, get_seasonal_tips
     st.markdown("### 🌤️ Plant Care Dashboard")
     
     # Weather recommendations section
     st.markdown("#### Today's Care Recommendations")
-    weather_data, recommendations = get_weather_recommendations()
+    user_profile = cached_user_profile(st.session_state.username)
+    weather_data, recommendations = get_weather_recommendations(user_profile.get('location'))
     
     # Display current conditions
     col1, col2, col3, col4 = st.columns(4)
@@ -973,6 +1109,7 @@ def care_dashboard_tab():
         st.metric("Rainfall", f"{weather_data['rainfall']}mm")
     with col4:
         st.metric("UV Index", weather_data['uv_index'])
+    st.caption(f"Forecast: {weather_data['forecast']}")
     
     # Display recommendations
     for rec in recommendations:
@@ -994,7 +1131,7 @@ def care_dashboard_tab():
         st.markdown("#### Plant Health Overview")
         
         health_counts = {}
-        for plant in st.session_state.plants:
+        for plant in get_plant_list():
             status = plant['health_status']
             health_counts[status] = health_counts.get(status, 0) + 1
         
@@ -1007,6 +1144,12 @@ def care_dashboard_tab():
             st.metric("Sick", health_counts.get("Sick", 0), delta="Alert" if health_counts.get("Sick", 0) > 0 else None)
         with col4:
             st.metric("Recovering", health_counts.get("Recovering", 0))
+        
+        upcoming = get_upcoming_care_tasks(days=7)
+        if upcoming:
+            st.markdown("#### Upcoming Care (Next 7 Days)")
+            for task in upcoming[:10]:
+                st.write(f"• {task['due_date']}: {task['plant']} - {task['task']}")
     
     # Quick actions
     st.markdown("#### Quick Actions")
@@ -1024,6 +1167,58 @@ def care_dashboard_tab():
         if st.button("🧪 Fertilizer Check", use_container_width=True):
             st.info("Review fertilizing schedule - most plants need feeding every 2-4 weeks during growing season")
 
+def admin_metrics_panel():
+    """Admin-only view of timing histograms, login rate limiting, inference batching and image workers"""
+    from rate_limit import get_login_limiter
+    from inference_scheduler import scheduler_metrics
+    from image_workers import image_worker_metrics
+    
+    with st.sidebar.expander("🛠️ Performance Metrics"):
+        if not INSTRUMENTATION_ENABLED:
+            st.info("Timing instrumentation is off. Set AGRICARE_INSTRUMENTATION=1 to enable it.")
+        else:
+            summaries = REGISTRY.summaries()
+            if summaries:
+                st.dataframe(
+                    [
+                        {"name": name, "calls": summary["count"], "mean ms": round(summary["mean_ms"], 2),
+                         "p50 ms": round(summary["p50_ms"], 2), "p95 ms": round(summary["p95_ms"], 2),
+                         "max ms": round(summary["max_ms"], 2), "total s": round(summary["total_s"], 3)}
+                        for name, summary in summaries.items()
+                    ],
+                    hide_index=True
+                )
+            else:
+                st.caption("No timings recorded yet.")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Export", key="export_metrics"):
+                    REGISTRY.export()
+                    st.success(f"Written to {METRICS_FILE}")
+            with col2:
+                if st.button("Reset", key="reset_metrics"):
+                    REGISTRY.reset()
+                    st.rerun()
+        
+        st.markdown("**Login rate limiting**")
+        st.json(get_login_limiter().metrics())
+        
+        inference_metrics = scheduler_metrics()
+        if inference_metrics is not None:
+            st.markdown("**Inference batching**")
+            st.json(inference_metrics)
+        
+        st.markdown("**Image worker processes**")
+        st.json(image_worker_metrics())
+
 if __name__ == "__main__":
+    init_app()
+    rerun_start = time.perf_counter()
     display_sidebar()
     main()
+    if is_admin():
+        admin_metrics_panel()
+    if INSTRUMENTATION_ENABLED:
+        REGISTRY.observe("app.rerun", time.perf_counter() - rerun_start)
+        REGISTRY.maybe_export()
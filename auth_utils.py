@@ -1,14 +1,25 @@
 import streamlit as st
-import hashlib
 import json
+import math
 import os
 from datetime import datetime
-from database import init_database, save_user_to_db, get_user_from_db
+from database import init_database, save_user_to_db, get_user_from_db, update_user_password_hash
+from passwords import hash_password, verify_password, needs_rehash
+from instrumentation import timed
+from rate_limit import get_login_limiter
+from storage import read_json, save_json, update_json
 
 # Simple file-based user storage (in production, use a proper database)
 USERS_FILE = "users.json"
 USER_DATA_DIR = "user_data"
 
+# Usernames allowed to see the admin panels, comma-separated
+ADMIN_USERS = {name.strip() for name in os.environ.get("AGRICARE_ADMIN_USERS", "").split(",") if name.strip()}
+
+# Reverse proxies in front of the app that append to X-Forwarded-For; 0 means
+# the header is ignored, since without a proxy the client writes all of it
+TRUSTED_PROXIES = int(os.environ.get("AGRICARE_TRUSTED_PROXIES", "0"))
+
 def init_auth():
     """Initialize authentication system"""
     if 'authenticated' not in st.session_state:
@@ -20,39 +31,71 @@ def init_auth():
     if not os.path.exists(USER_DATA_DIR):
         os.makedirs(USER_DATA_DIR)
 
-def hash_password(password):
-    """Hash password for secure storage"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def load_users():
     """Load users from file"""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    try:
+        return read_json(USERS_FILE, {})
+    except OSError:
+        return {}
 
 def save_users(users):
     """Save users to file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+    save_json(USERS_FILE, users)
+
+def _invalidate_cached_profile(username):
+    """Drop the dashboard's cached copy of a profile after its database row changes"""
+    from dashboard_cache import invalidate_user_profile
+    invalidate_user_profile(username)
 
 def register_user(username, password, email, user_type, location="", farm_size=""):
     """Register a new user"""
-    return save_user_to_db(username, hash_password(password), email, user_type, location, farm_size)
+    registered, message = save_user_to_db(username, hash_password(password), email, user_type, location, farm_size)
+    if registered:
+        _invalidate_cached_profile(username)
+    return registered, message
+
+def get_client_address():
+    """Client IP for rate limiting
+    
+    Behind TRUSTED_PROXIES proxies this is the X-Forwarded-For hop the
+    outermost one appended (counting from the right); hops further left are
+    whatever the client sent. Otherwise it is the socket peer.
+    """
+    try:
+        if TRUSTED_PROXIES:
+            forwarded = st.context.headers.get("X-Forwarded-For")
+            hops = [hop.strip() for hop in forwarded.split(",")] if forwarded else []
+            if len(hops) >= TRUSTED_PROXIES:
+                return hops[-TRUSTED_PROXIES]
+        return st.context.ip_address
+    except Exception:
+        return None
 
 def login_user(username, password):
     """Login user"""
+    limiter = get_login_limiter()
+    allowed, retry_after = limiter.check(username, get_client_address())
+    if not allowed:
+        return False, f"Too many login attempts. Please try again in {math.ceil(retry_after)} seconds."
+    
     user = get_user_from_db(username)
     
     if not user:
         return False, "User not found"
     
-    if user["password_hash"] != hash_password(password):
+    if not verify_password(password, user["password_hash"]):
         return False, "Invalid password"
     
+    # Upgrade legacy or outdated hashes now that the plain password is known
+    if needs_rehash(user["password_hash"]):
+        try:
+            update_user_password_hash(username, hash_password(password))
+            _invalidate_cached_profile(username)
+        except Exception as e:
+            print(f"Failed to upgrade password hash for {username}: {str(e)}")
+    
+    limiter.reset_user(username)
+    
     # Set session state
     st.session_state.authenticated = True
     st.session_state.username = username
@@ -61,41 +104,62 @@ def login_user(username, password):
     
     return True, "Login successful"
 
+def is_admin(username=None):
+    """Whether the (logged-in) user is an admin"""
+    username = username or (st.session_state.get("username") if st.session_state.get("authenticated") else None)
+    return bool(username) and username in ADMIN_USERS
+
 def logout_user():
     """Logout user"""
     st.session_state.authenticated = False
     st.session_state.username = None
     st.session_state.user_type = None
+    st.session_state.plants_loaded_for = None
 
 def get_user_data_path(username, filename):
     """Get path for user data file"""
     return os.path.join(USER_DATA_DIR, username, filename)
 
-def save_user_plants(username, plants, logs):
-    """Save user's plant data"""
-    data = {
-        "plants": plants,
-        "logs": logs,
-        "last_updated": datetime.now().isoformat()
-    }
+def update_user_plants(username, update):
+    """Atomically read-modify-write a user's plant data
+    
+    `update` receives (plants, logs) and returns the new (plants, logs), which
+    are also returned. Every change to a user's plants goes through here, so
+    sessions only ever change the stored records they touched.
+    """
+    def apply(data):
+        plants, logs = update(data.get("plants", []), data.get("logs", []))
+        return {"plants": plants, "logs": logs, "last_updated": datetime.now().isoformat()}
     
     filepath = get_user_data_path(username, "plants.json")
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=2)
+    data = update_json(filepath, apply, default={})
+    return data["plants"], data["logs"]
 
+@timed()
 def load_user_plants(username):
     """Load user's plant data"""
     filepath = get_user_data_path(username, "plants.json")
     
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-                return data.get("plants", []), data.get("logs", [])
-        except:
-            return [], []
+    try:
+        data = read_json(filepath)
+    except OSError:
+        return [], []
+    if data is None:
+        return [], []
+    
+    plants, logs = data.get("plants", []), data.get("logs", [])
     
-    return [], []
+    # Move logs past the hot window into the columnar archive
+    from log_archive import archive_old_logs
+    hot_logs = archive_old_logs(username, logs)
+    if len(hot_logs) != len(logs):
+        # Drop just the archived entries; logs appended meanwhile are kept
+        hot_ids = {id(log) for log in hot_logs}
+        archived = {json.dumps(log, sort_keys=True) for log in logs if id(log) not in hot_ids}
+        plants, hot_logs = update_user_plants(username, lambda stored_plants, stored_logs: (
+            stored_plants, [log for log in stored_logs if json.dumps(log, sort_keys=True) not in archived]
+        ))
+    return plants, hot_logs
 
 def get_user_profile(username):
     """Get user profile information"""
@@ -103,10 +167,15 @@ def get_user_profile(username):
     return user if user else {}
 
 def update_user_profile(username, updates):
-    """Update user profile"""
-    users = load_users()
-    if username in users:
-        users[username].update(updates)
-        save_users(users)
-        return True
-    return False
\ No newline at end of file
+    """Update a user's entry in the legacy users.json (profiles are read from the database)"""
+    found = False
+    
+    def apply(users):
+        nonlocal found
+        if username in users:
+            users[username].update(updates)
+            found = True
+        return users
+    
+    update_json(USERS_FILE, apply, default={})
+    return found
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+On-disk JSON Lines catalogs for the plant encyclopedia and disease database
+
+A catalog file holds one JSON object per line. The first line is a header
+({"_meta": {"kind": ..., "version": ...}}), every other line is an entry with a
+"name" field. A sidecar index (<catalog>.idx) maps each name to the byte offset
+and length of its line, so opening a catalog only reads the index; entries are
+parsed on first access from a memory-mapped view of the file and kept in an
+LRU cache. Catalogs are replaced atomically, and a changed file is picked up
+on the next access without a restart.
+"""
+import json
+import mmap
+import os
+import threading
+import time
+from collections.abc import Mapping
+from functools import lru_cache
+
+from storage import write_atomic
+
+CATALOG_DIR = os.environ.get("AGRICARE_CATALOG_DIR", "catalogs")
+INDEX_SUFFIX = ".idx"
+
+# Number of parsed entries kept in memory per catalog
+DEFAULT_CACHE_SIZE = 256
+
+# Minimum seconds between checks of the catalog file for changes
+RELOAD_CHECK_INTERVAL = 2.0
+
+def _file_signature(path):
+    """Identify a version of a file on disk by inode, size and modification time"""
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+def build_catalog_index(path):
+    """Scan a catalog file once and write its name -> (offset, length) sidecar index"""
+    signature = _file_signature(path)
+    meta = {}
+    entries = []
+
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            stripped = line.strip()
+            if stripped:
+                # A full parse per line just to read the name: building the index
+                # costs one pass over the whole catalog (only when it is missing
+                # or stale); opening with a current index doesn't
+                record = json.loads(stripped)
+                if "_meta" in record:
+                    meta = record["_meta"]
+                else:
+                    entries.append([record["name"], offset, len(line)])
+            offset += len(line)
+
+    index = {"source": signature, "meta": meta, "entries": entries}
+    write_atomic(path + INDEX_SUFFIX, lambda f: f.write(json.dumps(index).encode('utf-8')))
+    return index
+
+def load_catalog_index(path):
+    """Load the sidecar index for a catalog, rebuilding it if missing or stale"""
+    try:
+        with open(path + INDEX_SUFFIX, 'r') as f:
+            index = json.load(f)
+        if index.get("source") == _file_signature(path):
+            return index
+    except (OSError, ValueError):
+        pass
+    return build_catalog_index(path)
+
+def export_catalog(entries, path, kind, version=1):
+    """Write a mapping of name -> entry dict as a versioned catalog file"""
+    def write(f):
+        f.write(json.dumps({"_meta": {"kind": kind, "version": version}}).encode('utf-8') + b"\n")
+        for name, info in entries.items():
+            f.write(json.dumps({"name": name, **info}, ensure_ascii=False).encode('utf-8') + b"\n")
+
+    write_atomic(path, write)
+    build_catalog_index(path)
+
+class Catalog(Mapping):
+    """Read-only, lazily parsed mapping backed by a JSON Lines catalog file"""
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE, reload_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._file = None
+        self._mmap = None
+        self._offsets = {}
+        self._load_entry = lru_cache(maxsize=cache_size)(self._parse_entry)
+        self._open()
+
+    def _open(self):
+        """Map the catalog file and load its index"""
+        index = load_catalog_index(self.path)
+        self._close()
+        self._signature = index["source"]
+        self.meta = index.get("meta", {})
+        self._offsets = {name: (offset, length) for name, offset, length in index["entries"]}
+        self._file = open(self.path, 'rb')
+        if self._signature[1] > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load_entry.cache_clear()
+        self._last_check = time.monotonic()
+        self.generation += 1
+
+    def _close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def version(self):
+        return self.meta.get("version")
+
+    def check_reload(self):
+        """Reopen the catalog if the file changed on disk; returns the current generation"""
+        if time.monotonic() - self._last_check < self.reload_interval:
+            return self.generation
+
+        with self._lock:
+            self._last_check = time.monotonic()
+            try:
+                if _file_signature(self.path) != self._signature:
+                    self._open()
+            except OSError:
+                # Keep serving the mapped version while the file is being replaced
+                pass
+            return self.generation
+
+    def _parse_entry(self, name):
+        with self._lock:
+            offset, length = self._offsets[name]
+            line = self._mmap[offset:offset + length]
+        record = json.loads(line)
+        record.pop("name", None)
+        return record
+
+    def __getitem__(self, name):
+        self.check_reload()
+        if name not in self._offsets:
+            raise KeyError(name)
+        return self._load_entry(name)
+
+    def __contains__(self, name):
+        self.check_reload()
+        return name in self._offsets
+
+    def __iter__(self):
+        self.check_reload()
+        return iter(list(self._offsets))
+
+    def __len__(self):
+        self.check_reload()
+        return len(self._offsets)
+
+    def cache_info(self):
+        """Hit/miss statistics of the parsed entry cache"""
+        return self._load_entry.cache_info()
+
+def catalog_path(filename):
+    """Path of a catalog file in the configured catalog directory"""
+    return os.path.join(CATALOG_DIR, filename)
+
+def load_catalog(filename, builtin):
+    """Open a catalog from the catalog directory, falling back to the built-in data"""
+    path = catalog_path(filename)
+    if os.path.exists(path):
+        try:
+            return Catalog(path)
+        except Exception as e:
+            print(f"Failed to load catalog {path}, using built-in data: {str(e)}")
+    return builtin
+
+def catalog_generation(entries):
+    """Change counter for a loaded catalog; built-in dicts never change"""
+    if isinstance(entries, Catalog):
+        return entries.check_reload()
+    return 0
+
+if __name__ == "__main__":
+    # Export the built-in data as the initial catalog files
+    from disease_info import BUILTIN_DISEASE_INFO, DISEASE_CATALOG_FILE
+    from plant_encyclopedia import BUILTIN_PLANT_ENCYCLOPEDIA, PLANT_CATALOG_FILE
+
+    export_catalog(BUILTIN_DISEASE_INFO, catalog_path(DISEASE_CATALOG_FILE), kind="diseases")
+    export_catalog(BUILTIN_PLANT_ENCYCLOPEDIA, catalog_path(PLANT_CATALOG_FILE), kind="plants")
+    print(f"Exported catalogs to {CATALOG_DIR}")
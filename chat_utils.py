@@ -1,26 +1,33 @@
 import os
 import re
-from disease_info import get_disease_info, search_diseases, get_all_diseases
+from functools import lru_cache
+from dependencies import module_available
+from disease_info import get_disease_info, search_diseases, match_disease_name
+from instrumentation import timed
 
-# Try to initialize Gemini client if key is available
-try:
-    from google import genai
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if api_key and len(api_key) > 20:  # Basic validation
-        client = genai.Client(api_key=api_key)
-        GEMINI_AVAILABLE = True
-    else:
-        GEMINI_AVAILABLE = False
-        client = None
-except:
-    GEMINI_AVAILABLE = False
-    client = None
+# Gemini is used when a key is configured and google-genai is installed. The
+# package is only imported, and the client created, on the first request.
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_AVAILABLE = bool(GEMINI_API_KEY and len(GEMINI_API_KEY) > 20 and module_available("google.genai"))  # Basic validation
+
+@lru_cache(maxsize=1)
+def get_gemini_client():
+    """Gemini client, created on first use; None if it can't be created"""
+    if not GEMINI_AVAILABLE:
+        return None
+    try:
+        from google import genai
+        return genai.Client(api_key=GEMINI_API_KEY)
+    except Exception:
+        return None
 
+@timed()
 def get_plant_expert_response(user_message, chat_history=[]):
     """Get AI response for plant disease consultation"""
     
     # First try Gemini if available
-    if GEMINI_AVAILABLE and client:
+    client = get_gemini_client()
+    if client:
         try:
             # Create comprehensive prompt with context
             system_context = """You are a professional plant pathologist and agricultural expert specializing in plant disease diagnosis and treatment. 
@@ -73,6 +80,7 @@ Format your responses with:
         # Use local expert system
         return get_local_plant_expert_response(user_message, chat_history)
 
+@timed()
 def get_local_plant_expert_response(user_message, chat_history=[]):
     """Local plant expert system when OpenAI is not available"""
     
@@ -154,6 +162,7 @@ Common plant problems I can help with include:
 
 The more details you provide, the better I can assist you!"""
 
+@timed()
 def analyze_symptoms_for_diseases(description):
     """Analyze text description to suggest possible diseases"""
     
@@ -188,16 +197,10 @@ def analyze_symptoms_for_diseases(description):
     disease_suggestions = []
     
     for disease in unique_diseases[:5]:  # Limit to top 5 suggestions
-        # Try to find matching disease in our database
-        all_diseases = get_all_diseases()
-        matching_disease = None
-        
-        for db_disease in all_diseases:
-            if any(d in db_disease.lower() for d in disease.lower().split('_')):
-                matching_disease = db_disease
-                break
+        # Find the best matching disease in our database through the name index
+        matching_disease = match_disease_name(disease)
         
-        if matching_disease:
+        if matching_disease and all(s['name'] != matching_disease for s in disease_suggestions):
             disease_info = get_disease_info(matching_disease)
             disease_suggestions.append({
                 'name': matching_disease,
@@ -0,0 +1,54 @@
+"""
+Cached data behind the dashboard sections
+
+Streamlit reruns the whole script on every widget interaction, including
+clicks in unrelated tabs. The community queries behind the dashboards are the
+same for every session and change slowly, so they are cached process-wide
+with a TTL, and cleared explicitly when the data behind them changes (disease
+stats when a detection is logged).
+"""
+import streamlit as st
+
+from database import get_community_disease_stats, get_plant_images, get_success_stories, log_disease_detection_db
+from auth_utils import get_user_profile
+
+# Seconds before cached data is re-read
+DISEASE_STATS_TTL = 300
+PLANT_IMAGES_TTL = 3600
+SUCCESS_STORIES_TTL = 3600
+REGIONAL_TIPS_TTL = 24 * 3600
+USER_PROFILE_TTL = 300
+
+# Profile fields the dashboards read; credentials never go into the shared cache
+CACHED_PROFILE_FIELDS = ["username", "user_type", "location", "farm_size"]
+
+@st.cache_data(ttl=DISEASE_STATS_TTL, show_spinner=False)
+def cached_disease_stats():
+    return get_community_disease_stats()
+
+@st.cache_data(ttl=PLANT_IMAGES_TTL, show_spinner=False)
+def cached_plant_images(plant_name=None, category=None):
+    return get_plant_images(plant_name=plant_name, category=category)
+
+@st.cache_data(ttl=SUCCESS_STORIES_TTL, show_spinner=False)
+def cached_success_stories():
+    return get_success_stories()
+
+@st.cache_data(ttl=REGIONAL_TIPS_TTL, show_spinner=False)
+def cached_regional_tips(location):
+    from social_features import get_regional_tips
+    return get_regional_tips(location)
+
+@st.cache_data(ttl=USER_PROFILE_TTL, show_spinner=False)
+def cached_user_profile(username):
+    profile = get_user_profile(username)
+    return {field: profile[field] for field in CACHED_PROFILE_FIELDS if field in profile}
+
+def record_disease_detection(user_id, plant_name, disease_name, confidence, location=""):
+    """Log a detection and drop the cached stats it changes"""
+    log_disease_detection_db(user_id, plant_name, disease_name, confidence, location)
+    cached_disease_stats.clear()
+
+def invalidate_user_profile(username):
+    """Drop a cached profile after it changes"""
+    cached_user_profile.clear(username)
@@ -1,15 +1,31 @@
 import sqlite3
 import json
 import os
+import threading
 from datetime import datetime
+from instrumentation import timed
 
 DB_FILE = "agricare.db"
 
-def init_database():
-    """Initialize the SQLite database with all necessary tables"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+# Bump when the schema or seed data changes, and add the upgrade to _migrate
+SCHEMA_VERSION = 1
+
+_database_initialized = False
+_init_lock = threading.Lock()
+
+class SchemaVersionError(RuntimeError):
+    """The database was created or upgraded by a newer version of the app"""
+
+    def __init__(self, db_file, version, supported_version):
+        self.version = version
+        self.supported_version = supported_version
+        super().__init__(
+            f"Database {db_file} has schema version {version}, but this app supports up to "
+            f"version {supported_version}; upgrade the app instead of running it against this database"
+        )
+
+def _create_schema(cursor):
+    """Create any missing tables"""
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -83,6 +99,21 @@ def init_database():
         )
     ''')
     
+    # Success stories table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS success_stories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farmer_name TEXT,
+            location TEXT,
+            crop TEXT,
+            story TEXT,
+            impact TEXT,
+            date_added TEXT
+        )
+    ''')
+
+def _seed_sample_data(cursor):
+    """Insert the sample images and success stories into empty tables"""
     # Insert sample plant images
     sample_images = [
         ("Tomato", "Healthy", "https://images.unsplash.com/photo-1592924357228-91a4daadcfea?w=400", "Healthy tomato plant with vibrant green leaves", "healthy"),
@@ -97,23 +128,11 @@ def init_database():
         ("Lettuce", "Healthy", "https://images.unsplash.com/photo-1556075798-4825dfaaf498?w=400", "Fresh lettuce in garden", "healthy")
     ]
     
-    cursor.executemany('''
-        INSERT OR IGNORE INTO plant_images (plant_name, disease_name, image_url, description, category)
-        VALUES (?, ?, ?, ?, ?)
-    ''', sample_images)
-    
-    # Insert sample success stories
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS success_stories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            farmer_name TEXT,
-            location TEXT,
-            crop TEXT,
-            story TEXT,
-            impact TEXT,
-            date_added TEXT
-        )
-    ''')
+    if cursor.execute("SELECT COUNT(*) FROM plant_images").fetchone()[0] == 0:
+        cursor.executemany('''
+            INSERT INTO plant_images (plant_name, disease_name, image_url, description, category)
+            VALUES (?, ?, ?, ?, ?)
+        ''', sample_images)
     
     sample_stories = [
         ("Rajesh K.", "Punjab, India", "Tomatoes", "Used the AI detection to identify early blight in tomatoes. Early intervention saved 80% of my crop!", "Saved $2,000 in potential losses", datetime.now().isoformat()),
@@ -123,14 +142,72 @@ def init_database():
         ("Carlos M.", "Brazil", "Coffee", "The plant encyclopedia guided me through organic pest management, improving coffee quality.", "30% improvement in bean quality", datetime.now().isoformat())
     ]
     
-    cursor.executemany('''
-        INSERT OR IGNORE INTO success_stories (farmer_name, location, crop, story, impact, date_added)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', sample_stories)
+    if cursor.execute("SELECT COUNT(*) FROM success_stories").fetchone()[0] == 0:
+        cursor.executemany('''
+            INSERT INTO success_stories (farmer_name, location, crop, story, impact, date_added)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', sample_stories)
+
+def _migrate(cursor, version):
+    """Upgrade an existing database from `version` to SCHEMA_VERSION"""
+    if version < 1:
+        # Before versioning, every run re-inserted the sample rows
+        cursor.execute('''
+            DELETE FROM plant_images WHERE id NOT IN (
+                SELECT MIN(id) FROM plant_images
+                GROUP BY plant_name, disease_name, image_url, description, category
+            )
+        ''')
+        cursor.execute('''
+            DELETE FROM success_stories WHERE id NOT IN (
+                SELECT MIN(id) FROM success_stories
+                GROUP BY farmer_name, location, crop, story, impact
+            )
+        ''')
+
+@timed()
+def init_database():
+    """Initialize the SQLite database with all necessary tables
     
-    conn.commit()
-    conn.close()
+    Runs once per process. A database already at SCHEMA_VERSION (stored in
+    PRAGMA user_version) is left untouched, so later calls and other
+    processes do no DDL and no writes. A database from a newer version of the
+    app is refused rather than downgraded.
+    """
+    global _database_initialized
+    if _database_initialized:
+        return
+    
+    with _init_lock:
+        if _database_initialized:
+            return
+        
+        conn = sqlite3.connect(DB_FILE, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise SchemaVersionError(DB_FILE, version, SCHEMA_VERSION)
+            if version < SCHEMA_VERSION:
+                # Take the write lock, then check again in case another process just upgraded
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                    if version < SCHEMA_VERSION:
+                        _create_schema(cursor)
+                        _migrate(cursor, version)
+                        _seed_sample_data(cursor)
+                        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+        finally:
+            conn.close()
+        
+        _database_initialized = True
 
+@timed()
 def get_plant_images(plant_name=None, category=None):
     """Get plant images from database"""
     conn = sqlite3.connect(DB_FILE)
@@ -163,6 +240,7 @@ def get_plant_images(plant_name=None, category=None):
         for row in results
     ]
 
+@timed()
 def get_success_stories():
     """Get success stories from database"""
     conn = sqlite3.connect(DB_FILE)
@@ -183,6 +261,7 @@ def get_success_stories():
         for row in results
     ]
 
+@timed()
 def save_user_to_db(username, password_hash, email, user_type, location="", farm_size=""):
     """Save user to database"""
     conn = sqlite3.connect(DB_FILE)
@@ -201,6 +280,7 @@ def save_user_to_db(username, password_hash, email, user_type, location="", farm
     finally:
         conn.close()
 
+@timed()
 def get_user_from_db(username):
     """Get user from database"""
     conn = sqlite3.connect(DB_FILE)
@@ -224,6 +304,18 @@ def get_user_from_db(username):
         }
     return None
 
+@timed()
+def update_user_password_hash(username, password_hash):
+    """Replace a user's stored password hash"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username))
+    
+    conn.commit()
+    conn.close()
+
+@timed()
 def save_plant_to_db(user_id, name, species, location, health_status, notes):
     """Save plant to database"""
     conn = sqlite3.connect(DB_FILE)
@@ -239,6 +331,7 @@ def save_plant_to_db(user_id, name, species, location, health_status, notes):
     conn.close()
     return plant_id
 
+@timed()
 def get_user_plants(user_id):
     """Get user's plants from database"""
     conn = sqlite3.connect(DB_FILE)
@@ -264,6 +357,7 @@ def get_user_plants(user_id):
         for row in results
     ]
 
+@timed()
 def log_disease_detection_db(user_id, plant_name, disease_name, confidence, location=""):
     """Log disease detection to database"""
     conn = sqlite3.connect(DB_FILE)
@@ -277,6 +371,7 @@ def log_disease_detection_db(user_id, plant_name, disease_name, confidence, loca
     conn.commit()
     conn.close()
 
+@timed()
 def get_community_disease_stats():
     """Get community disease statistics"""
     conn = sqlite3.connect(DB_FILE)
@@ -0,0 +1,16 @@
+"""
+Checks for optional dependencies
+
+Optional packages (Gemini, the inference runtimes) are looked up without
+importing them, so a missing or slow-to-import package costs nothing until
+the feature that needs it is used.
+"""
+from importlib.util import find_spec
+
+def module_available(name):
+    """Whether a module can be imported, without importing it"""
+    try:
+        return find_spec(name) is not None
+    except ImportError:
+        # A dotted name whose parent package is missing
+        return False
@@ -1,8 +1,15 @@
 """
 Disease information database containing descriptions, symptoms, and treatments
 """
+import threading
+from functools import lru_cache
 
-DISEASE_INFO = {
+from catalog import catalog_generation, load_catalog
+from search_engine import SearchIndex, normalize_text, tokenize
+
+DISEASE_CATALOG_FILE = "diseases.jsonl"
+
+BUILTIN_DISEASE_INFO = {
     'Apple - Apple Scab': {
         'description': 'A fungal disease that affects apple trees, causing dark, scaly lesions on leaves and fruit.',
         'symptoms': [
@@ -242,20 +249,93 @@ DISEASE_INFO = {
     }
 }
 
+# Loaded from the on-disk catalog when one exists, otherwise the built-in entries
+DISEASE_INFO = load_catalog(DISEASE_CATALOG_FILE, BUILTIN_DISEASE_INFO)
+
+# Relative importance of each field when ranking search results
+DISEASE_FIELD_WEIGHTS = {
+    'name': 3.0,
+    'symptoms': 1.5,
+    'description': 1.0,
+    'treatments': 0.5
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _get_indexes():
+    """Search indexes over DISEASE_INFO, built on first use and after a catalog reload"""
+    generation = catalog_generation(DISEASE_INFO)
+    if _indexes.get('generation') == generation:
+        return _indexes
+    
+    with _indexes_lock:
+        if _indexes.get('generation') != generation:
+            names = list(DISEASE_INFO)
+            _indexes['full_text'] = SearchIndex(
+                {
+                    name: {
+                        'name': name,
+                        'description': DISEASE_INFO[name]['description'],
+                        'symptoms': DISEASE_INFO[name]['symptoms'],
+                        'treatments': DISEASE_INFO[name]['treatments']
+                    }
+                    for name in names
+                },
+                field_weights=DISEASE_FIELD_WEIGHTS
+            )
+            _indexes['names'] = SearchIndex({name: {'name': name} for name in names})
+            _indexes['normalized'] = {normalize_text(name).strip(): name for name in names}
+            _indexes['order'] = {name: position for position, name in enumerate(names)}
+            _resolve_disease_name.cache_clear()
+            _match_disease_name.cache_clear()
+            _indexes['generation'] = generation
+    return _indexes
+
+@lru_cache(maxsize=1024)
+def _resolve_disease_name(disease_name):
+    indexes = _get_indexes()
+    normalized = normalize_text(disease_name).strip()
+    if normalized in indexes['normalized']:
+        return indexes['normalized'][normalized]
+    
+    # Partial match where one name contains the other; only names sharing a
+    # term with the query can qualify, so the name index narrows the candidates
+    name_lower = disease_name.lower()
+    candidates = [
+        key for key, _ in indexes['names'].search(disease_name, typos=False)
+        if name_lower in key.lower() or key.lower() in name_lower
+    ]
+    if candidates:
+        return min(candidates, key=indexes['order'].get)
+    
+    return None
+
+@lru_cache(maxsize=1024)
+def _match_disease_name(query):
+    results = _get_indexes()['names'].search(query.replace('_', ' '), limit=1)
+    return results[0][0] if results else None
+
+def resolve_disease_name(disease_name):
+    """Resolve a disease name or model label to its DISEASE_INFO key, or None"""
+    if disease_name in DISEASE_INFO:
+        return disease_name
+    
+    # Rebuilds the indexes (and drops cached lookups) if the catalog was reloaded
+    _get_indexes()
+    return _resolve_disease_name(disease_name)
+
+def match_disease_name(query):
+    """Find the disease whose name best matches a loose query such as 'Late_blight'"""
+    _get_indexes()
+    return _match_disease_name(query)
+
 def get_disease_info(disease_name):
     """Get information about a specific disease"""
-    # Handle variations in disease names
-    disease_key = disease_name
-    
-    # Try exact match first
-    if disease_key in DISEASE_INFO:
+    disease_key = resolve_disease_name(disease_name)
+    if disease_key is not None:
         return DISEASE_INFO[disease_key]
     
-    # Try to find partial matches
-    for key in DISEASE_INFO.keys():
-        if disease_name.lower() in key.lower() or key.lower() in disease_name.lower():
-            return DISEASE_INFO[key]
-    
     # Return default info if no match found
     return {
         'description': f'Information about {disease_name} is not available in our database.',
@@ -268,15 +348,9 @@ def get_all_diseases():
     """Get list of all diseases in the database"""
     return list(DISEASE_INFO.keys())
 
-def search_diseases(query):
-    """Search for diseases matching a query"""
-    query = query.lower()
-    matches = []
-    
-    for disease_name, info in DISEASE_INFO.items():
-        if (query in disease_name.lower() or 
-            query in info['description'].lower() or
-            any(query in symptom.lower() for symptom in info['symptoms'])):
-            matches.append(disease_name)
+def search_diseases(query, limit=None):
+    """Search names, descriptions, symptoms and treatments, best matches first"""
+    if not tokenize(query):
+        return get_all_diseases()[:limit]
     
-    return matches
+    return [name for name, _ in _get_indexes()['full_text'].search(query, limit=limit)]
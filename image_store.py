@@ -0,0 +1,217 @@
+"""
+Local, content-addressed store for reference gallery images
+
+Images are fetched (or imported from local files) once and stored under the
+SHA-256 of their bytes, with JPEG thumbnails in THUMBNAIL_SIZES next to them:
+
+    image_store/originals/ab/abcd....jpg
+    image_store/thumbnails/ab/abcd..._small.jpg
+    image_store/sources.json        source URL -> digest, ETag, Last-Modified
+
+Rendering only reads this store; it never fetches. Images missing from the
+store are fetched in the background and the remote URL is shown meanwhile
+(unless AGRICARE_OFFLINE=1, in which case nothing is fetched). Refreshing a
+stored image sends If-None-Match / If-Modified-Since, so unchanged images
+aren't downloaded again, and identical content is only ever stored once.
+
+    python image_store.py    # fetch every image in plant_images and build thumbnails
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import read_json, update_json, write_bytes_atomic
+
+IMAGE_STORE_DIR = os.environ.get("AGRICARE_IMAGE_DIR", "image_store")
+OFFLINE = os.environ.get("AGRICARE_OFFLINE", "0") == "1"
+
+# Longest side in pixels
+THUMBNAIL_SIZES = {"small": 240, "medium": 480, "large": 960}
+THUMBNAIL_QUALITY = 82
+
+FETCH_TIMEOUT = 10
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+FETCH_CHUNK_SIZE = 64 * 1024
+
+SOURCES_FILE = os.path.join(IMAGE_STORE_DIR, "sources.json")
+
+_sources = {}
+_sources_signature = None
+_sources_lock = threading.Lock()
+_fetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-fetch")
+_fetching = set()
+
+def _original_path(digest):
+    return os.path.join(IMAGE_STORE_DIR, "originals", digest[:2], f"{digest}.img")
+
+def _thumbnail_path(digest, size):
+    return os.path.join(IMAGE_STORE_DIR, "thumbnails", digest[:2], f"{digest}_{size}.jpg")
+
+def _load_sources():
+    """Source map, re-read only when sources.json changed on disk"""
+    global _sources, _sources_signature
+    try:
+        stat = os.stat(SOURCES_FILE)
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        signature = None
+
+    with _sources_lock:
+        if signature != _sources_signature:
+            _sources = read_json(SOURCES_FILE, {}) if signature else {}
+            _sources_signature = signature
+        return _sources
+
+def make_thumbnail(data, max_side, quality=THUMBNAIL_QUALITY):
+    """JPEG bytes of an image scaled down to fit in max_side x max_side"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+def store_image(data):
+    """Store image bytes and their thumbnails by content; returns the digest
+
+    Content already in the store is not written again.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    original = _original_path(digest)
+    if not os.path.exists(original):
+        # Validate before storing anything
+        make_thumbnail(data, THUMBNAIL_SIZES["small"])
+        write_bytes_atomic(original, data)
+
+    for size, max_side in THUMBNAIL_SIZES.items():
+        path = _thumbnail_path(digest, size)
+        if not os.path.exists(path):
+            write_bytes_atomic(path, make_thumbnail(data, max_side))
+    return digest
+
+def _record_source(source, **fields):
+    def apply(sources):
+        sources[source] = {**sources.get(source, {}), **fields}
+        return sources
+    update_json(SOURCES_FILE, apply, default={})
+
+def import_image(path, source=None):
+    """Add a local image file, optionally registering it as the copy of a source URL"""
+    with open(path, 'rb') as f:
+        digest = store_image(f.read())
+    if source:
+        _record_source(source, digest=digest, fetched=time.time())
+    return digest
+
+def _read_limited(response, url, limit=MAX_IMAGE_BYTES):
+    """Body of a streamed response, abandoned as soon as it exceeds `limit` bytes"""
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise ValueError(f"Image at {url} is larger than {limit} bytes")
+
+    body = bytearray()
+    for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+        body += chunk
+        if len(body) > limit:
+            raise ValueError(f"Image at {url} is larger than {limit} bytes")
+    return bytes(body)
+
+def fetch_image(url, session=None):
+    """Fetch a URL into the store, revalidating with ETag/Last-Modified if it's already there
+
+    Returns the digest, or raises on network or image errors.
+    """
+    import requests
+
+    known = _load_sources().get(url, {})
+    headers = {}
+    if known.get("digest") and os.path.exists(_original_path(known["digest"])):
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    # Streamed, so an oversized body is cut off instead of downloaded in full
+    with (session or requests).get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            _record_source(url, fetched=time.time())
+            return known["digest"]
+        response.raise_for_status()
+        content = _read_limited(response, url)
+
+    digest = store_image(content)
+    _record_source(
+        url, digest=digest, fetched=time.time(),
+        etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified")
+    )
+    return digest
+
+def _fetch_in_background(url):
+    with _sources_lock:
+        if url in _fetching:
+            return
+        _fetching.add(url)
+
+    def run():
+        try:
+            fetch_image(url)
+        except Exception as e:
+            print(f"Failed to fetch gallery image {url}: {str(e)}")
+        finally:
+            with _sources_lock:
+                _fetching.discard(url)
+
+    _fetch_executor.submit(run)
+
+def cached_image(source, size="medium"):
+    """Local thumbnail path for an image source, or None if it isn't stored yet"""
+    entry = _load_sources().get(source)
+    if not entry or not entry.get("digest"):
+        return None
+    path = _thumbnail_path(entry["digest"], size)
+    if not os.path.exists(path):
+        original = _original_path(entry["digest"])
+        if not os.path.exists(original):
+            return None
+        with open(original, 'rb') as f:
+            store_image(f.read())
+    return path
+
+def gallery_image(source, size="medium"):
+    """What to pass to st.image for a gallery image: the local thumbnail when stored
+
+    Otherwise the image is fetched in the background for next time, and the
+    remote URL is returned (None when offline).
+    """
+    path = cached_image(source, size)
+    if path:
+        return path
+    if OFFLINE:
+        return None
+    _fetch_in_background(source)
+    return source
+
+def warm_image_store(urls, session=None):
+    """Fetch (or revalidate) every URL; returns {url: digest or error string}"""
+    results = {}
+    for url in urls:
+        try:
+            results[url] = fetch_image(url, session)
+        except Exception as e:
+            results[url] = f"error: {str(e)}"
+    return results
+
+if __name__ == "__main__":
+    from database import init_database, get_plant_images
+
+    init_database()
+    urls = sorted({image["image_url"] for image in get_plant_images() if image["image_url"]})
+    for url, result in warm_image_store(urls).items():
+        print(f"{result[:12] if not result.startswith('error') else result}  {url}")
@@ -0,0 +1,295 @@
+"""
+Process pool for CPU-heavy image work
+
+Decoding, resizing and segmenting uploads, and the color statistics behind
+SimplePlantClassifier, hold the GIL for much of their time, so on the
+Streamlit script threads one large upload stalls every other session in the
+process. With IMAGE_WORKERS > 0 this work runs in worker processes instead:
+
+- Pixel buffers travel through shared memory blocks (multiprocessing
+  shared_memory), not pickled arrays; only block names, shapes and the small
+  results are sent over the pool's pipes.
+- Large feature batches (lesion scans, augmented or micro-batched requests)
+  are split across the workers, so they scale across cores.
+- Workers are started and warmed up (imports, a first preprocess) before the
+  first real request, from a forkserver that has numpy, Pillow, model_utils
+  and streamlit preloaded where the platform supports it. Like any
+  multiprocessing child, a worker imports the main module (app.py under
+  Streamlit), so that module must have no side effects at import time.
+
+If a worker dies or a task times out, the pool is shut down and a fresh one
+is started on the next request; work that failed runs on the calling thread.
+After MAX_POOL_RESTARTS failures in a row, or if the pool can't be started,
+the pool is switched off, as with AGRICARE_IMAGE_WORKERS=0.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker processes (0 = run in the calling thread); by default one core is left for the app
+IMAGE_WORKERS = int(os.environ.get("AGRICARE_IMAGE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+
+# Batches smaller than this compute their features in the calling thread
+FEATURE_OFFLOAD_MIN_IMAGES = 8
+# Fewest images per worker chunk when a batch is split
+FEATURE_CHUNK_MIN_IMAGES = 4
+
+# Seconds to wait for a worker result before recycling the pool
+TASK_TIMEOUT = 60
+# Consecutive pool failures after which work stays in-thread
+MAX_POOL_RESTARTS = 3
+
+# Imported once by the forkserver, so workers start with them loaded: the image
+# pipeline, and streamlit for the main module each worker imports. "__main__"
+# itself only takes effect on Pythons whose forkserver honors it.
+_PRELOAD_MODULES = ["__main__", "numpy", "PIL.Image", "model_utils", "streamlit"]
+
+def _share(array):
+    """A shared memory block holding a copy of `array`, and its (name, shape, dtype)"""
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def _allocate(shape, dtype):
+    """An uninitialized shared memory block for an array, and its (name, shape, dtype)"""
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    return block, (block.name, tuple(shape), dtype.str)
+
+def _attach(spec):
+    """(block, array view) of a block created by the parent, in a worker; close the block when done"""
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _decode(data, input_size):
+    """Preprocessed image from encoded bytes
+
+    JPEGs are decoded in draft mode, which scales them down during decoding
+    (by up to 8x, never below input_size); much cheaper than decoding a
+    full-size photo only to shrink it.
+    """
+    from model_utils import preprocess_image
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', tuple(input_size))
+        return preprocess_image(image, input_size)
+
+def _release(*blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+# Worker side
+
+def _warm_worker():
+    """Pool initializer: import and exercise the pipeline once so the first request is fast"""
+    from model_utils import preprocess_image, segment_leaf, leaf_color_features
+    from PIL import Image
+
+    processed = preprocess_image(Image.new('RGB', (256, 256), (60, 140, 50)))
+    leaf_color_features(processed, segment_leaf(processed))
+
+def _ping():
+    return os.getpid()
+
+def _preprocess_task(data_spec, size, input_size, image_spec, mask_spec):
+    from model_utils import segment_leaf
+
+    data_block, data = _attach(data_spec)
+    image_block, image_out = _attach(image_spec)
+    mask_block, mask_out = _attach(mask_spec)
+    try:
+        processed = _decode(data[:size], input_size)
+        image_out[...] = processed
+        mask_out[...] = segment_leaf(processed)
+    finally:
+        for block in (data_block, image_block, mask_block):
+            block.close()
+
+def _features_task(image_spec, mask_spec, start, stop):
+    from model_utils import leaf_color_features
+
+    image_block, images = _attach(image_spec)
+    mask_block, masks = _attach(mask_spec)
+    try:
+        return leaf_color_features(images[start:stop], masks[start:stop])
+    finally:
+        image_block.close()
+        mask_block.close()
+
+# Parent side
+
+def _terminate(executor):
+    """Shut a pool down without waiting, stopping workers that may be stuck on a task"""
+    # Grab the processes first; shutdown() forgets them
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+class ImageWorkerPool:
+    """Lazily started process pool that falls back to in-thread execution"""
+
+    def __init__(self, workers=IMAGE_WORKERS):
+        self.workers = workers
+        self.enabled = workers > 0
+        self._executor = None
+        # Reentrant: a failed start disables the pool while holding it
+        self._lock = threading.RLock()
+        self._failures = 0
+        self.tasks_total = 0
+        self.fallbacks_total = 0
+        self.restarts_total = 0
+
+    def _start(self):
+        methods = multiprocessing.get_all_start_methods()
+        # fork would copy the app's threads and locks into the workers
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if context.get_start_method() == "forkserver":
+            context.set_forkserver_preload(_PRELOAD_MODULES)
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_worker)
+        try:
+            # Workers are spawned on demand; make them all start (and warm up) now
+            for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                future.result(timeout=TASK_TIMEOUT)
+        except BaseException:
+            _terminate(executor)
+            raise
+        return executor
+
+    def executor(self):
+        """The running pool, started on first use; None when the pool is off"""
+        if not self.enabled:
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None and self.enabled:
+                    try:
+                        self._executor = self._start()
+                    except Exception as e:
+                        self.disable(f"could not start image workers: {str(e)}")
+        return self._executor
+
+    def disable(self, reason):
+        """Switch to in-thread execution for the rest of the process"""
+        print(f"Image work runs in-thread from now on: {reason}")
+        with self._lock:
+            self.enabled = False
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            _terminate(executor)
+
+    def recycle(self, executor, reason):
+        """Replace a failed pool: it is shut down now and a new one starts on next use"""
+        with self._lock:
+            if self._executor is not executor:
+                # Another thread already recycled it
+                return
+            self._executor = None
+            self._failures += 1
+            failures = self._failures
+        _terminate(executor)
+        if failures >= MAX_POOL_RESTARTS:
+            self.disable(f"{reason} ({failures} failures in a row)")
+        else:
+            print(f"Restarting image workers: {reason}")
+            self.restarts_total += 1
+
+    def run(self, tasks):
+        """Run [(function, args)] in the pool and return their results
+
+        Returns None (after switching the pool off if it failed) when the
+        caller should do the work itself.
+        """
+        executor = self.executor()
+        if executor is None:
+            self.fallbacks_total += 1
+            return None
+        try:
+            futures = [executor.submit(function, *args) for function, args in tasks]
+            results = [future.result(timeout=TASK_TIMEOUT) for future in futures]
+        except (BrokenProcessPool, OSError, TimeoutError) as e:
+            self.recycle(executor, f"image worker failed: {str(e) or type(e).__name__}")
+            self.fallbacks_total += 1
+            return None
+        self._failures = 0
+        self.tasks_total += len(tasks)
+        return results
+
+    def metrics(self):
+        return {
+            "workers": self.workers if self.enabled else 0,
+            "started": self._executor is not None,
+            "tasks_total": self.tasks_total,
+            "in_thread_total": self.fallbacks_total,
+            "restarts_total": self.restarts_total
+        }
+
+_pool = ImageWorkerPool()
+
+def warm_image_workers():
+    """Start the worker processes ahead of the first analysis"""
+    _pool.executor()
+
+def image_worker_metrics():
+    return _pool.metrics()
+
+def preprocess_upload(data, input_size=(224, 224)):
+    """Decode, resize and segment uploaded image bytes
+
+    Returns (processed_image (1, H, W, 3) float32, masks (1, H, W) bool).
+    """
+    width, height = input_size
+    data_block, data_spec = _share(np.frombuffer(data, dtype=np.uint8))
+    image_block, image_spec = _allocate((1, height, width, 3), np.float32)
+    mask_block, mask_spec = _allocate((1, height, width), np.bool_)
+    try:
+        results = _pool.run([(_preprocess_task, (data_spec, len(data), tuple(input_size), image_spec, mask_spec))])
+        if results is not None:
+            # Copied out so the blocks can be released right away
+            processed = np.ndarray(image_spec[1], dtype=np.float32, buffer=image_block.buf).copy()
+            masks = np.ndarray(mask_spec[1], dtype=np.bool_, buffer=mask_block.buf).copy()
+            return processed, masks
+    finally:
+        _release(data_block, image_block, mask_block)
+
+    from model_utils import segment_leaf
+
+    processed = _decode(data, input_size)
+    return processed, segment_leaf(processed)
+
+def leaf_features(processed_image, masks):
+    """leaf_color_features, split across the workers for large batches"""
+    from model_utils import leaf_color_features
+
+    count = len(processed_image)
+    if count < FEATURE_OFFLOAD_MIN_IMAGES:
+        return leaf_color_features(processed_image, masks)
+    if _pool.executor() is None:
+        _pool.fallbacks_total += 1
+        return leaf_color_features(processed_image, masks)
+
+    chunks = max(1, min(_pool.workers, count // FEATURE_CHUNK_MIN_IMAGES))
+    bounds = np.linspace(0, count, chunks + 1).astype(int)
+    image_block, image_spec = _share(np.ascontiguousarray(processed_image, dtype=np.float32))
+    mask_block, mask_spec = _share(np.ascontiguousarray(masks, dtype=np.bool_))
+    try:
+        results = _pool.run([
+            (_features_task, (image_spec, mask_spec, int(start), int(stop)))
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ])
+    finally:
+        _release(image_block, mask_block)
+
+    if results is None:
+        return leaf_color_features(processed_image, masks)
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
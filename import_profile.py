@@ -0,0 +1,72 @@
+"""
+Import-time profile of the app's modules
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+so every measurement is a cold import that includes everything it pulls in.
+The report lists the total per module and its slowest dependencies, grouped
+by when app.py loads them: at startup (login page) or on first use by a tab.
+
+    python import_profile.py
+"""
+import subprocess
+import sys
+
+# What app.py imports at module level, i.e. before the login page renders
+STARTUP_MODULES = ["streamlit", "instrumentation", "auth_utils", "database", "dashboard_cache", "image_store"]
+
+# Imported inside the tab functions that use them
+TAB_MODULES = [
+    "plant_tracker", "plant_io", "plant_encyclopedia", "disease_info", "chat_utils",
+    "weather_utils", "social_features", "model_utils", "lesion_scan", "inference_scheduler", "image_workers"
+]
+
+def _import_times(code):
+    """(name, cumulative_us) entries reported by -X importtime for running `code`"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Running {code!r} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((name.rstrip(), int(cumulative)))
+    return entries
+
+def profile_import(module, top=5):
+    """Cold import time of a module in microseconds, with its `top` slowest dependencies
+
+    Imports done by interpreter startup (site and friends) are left out.
+    Returns (total_us, [(dependency, cumulative_us), ...]).
+    """
+    startup = len(_import_times("pass"))
+    entries = _import_times(f"import {module}")[startup:]
+
+    # Module names are indented by nesting depth; top-level imports are the roots
+    roots = [(name.strip(), cumulative) for name, cumulative in entries if not name.startswith("  ")]
+    total = sum(cumulative for _, cumulative in roots)
+    dependencies = sorted(
+        ((name.strip(), cumulative) for name, cumulative in entries if name.strip() != module),
+        key=lambda item: item[1], reverse=True
+    )
+    return total, dependencies[:top]
+
+def print_report(groups):
+    for title, modules in groups:
+        print(title)
+        for module in modules:
+            try:
+                total, dependencies = profile_import(module)
+            except RuntimeError as e:
+                print(f"  {module:<20} {e}")
+                continue
+            slowest = ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in dependencies)
+            print(f"  {module:<20} {total / 1000:>7.1f} ms   ({slowest})")
+        print()
+
+if __name__ == "__main__":
+    print_report([
+        ("Startup (login page):", STARTUP_MODULES),
+        ("Loaded on first use:", TAB_MODULES)
+    ])
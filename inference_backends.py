@@ -0,0 +1,298 @@
+"""
+Inference backends behind load_model / predict_disease
+
+A backend turns a batch of preprocessed images (float32 NHWC in [0, 1], the
+format every image stage in model_utils works with) into class probabilities
+(N, len(CLASS_NAMES)). Each backend declares the input it needs (size, dtype,
+layout) and converts the batch in prepare(), so preprocessing adapts to the
+model instead of the model to preprocessing.
+
+    heuristic   SimplePlantClassifier; no model file, uses leaf masks
+    savedmodel  TensorFlow SavedModel or Keras model (AGRICARE_SAVEDMODEL_PATH)
+    tflite      TFLite interpreter, from tflite_runtime or TensorFlow (AGRICARE_TFLITE_MODEL)
+    onnx        ONNX Runtime on CPU (AGRICARE_ONNX_MODEL)
+
+AGRICARE_INFERENCE_BACKEND selects one by name. The default, "auto", picks
+the first backend in AUTO_BACKEND_ORDER whose runtime is installed and whose
+model file exists, falling back to the heuristic classifier.
+
+AGRICARE_MODEL_VARIANT selects a quantized variant of the model (see
+quantization.py): "float16" or "int8" load e.g. plant_disease_int8.tflite
+next to the float32 model file.
+"""
+import os
+import threading
+
+import numpy as np
+
+from dependencies import module_available
+
+INFERENCE_BACKEND = os.environ.get("AGRICARE_INFERENCE_BACKEND", "auto")
+
+SAVEDMODEL_PATH = os.environ.get("AGRICARE_SAVEDMODEL_PATH", os.path.join("models", "plant_disease"))
+TFLITE_MODEL_PATH = os.environ.get("AGRICARE_TFLITE_MODEL", os.path.join("models", "plant_disease.tflite"))
+ONNX_MODEL_PATH = os.environ.get("AGRICARE_ONNX_MODEL", os.path.join("models", "plant_disease.onnx"))
+
+MODEL_VARIANT = os.environ.get("AGRICARE_MODEL_VARIANT", "float32")
+MODEL_VARIANTS = ("float32", "float16", "int8")
+
+# Threads for the CPU runtimes (0 = runtime default)
+INFERENCE_THREADS = int(os.environ.get("AGRICARE_INFERENCE_THREADS", "0"))
+
+# Fastest CPU runtime first
+AUTO_BACKEND_ORDER = ["onnx", "tflite", "savedmodel", "heuristic"]
+
+def variant_path(path, variant=None):
+    """Model file of a variant: the float32 path with the variant name appended"""
+    variant = variant or MODEL_VARIANT
+    if variant == "float32":
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{variant}{extension}"
+
+def _softmax_if_needed(outputs):
+    """Probabilities from model outputs that may be logits"""
+    outputs = np.asarray(outputs, dtype=np.float32)
+    if outputs.min() >= 0 and np.allclose(outputs.sum(axis=-1), 1.0, atol=1e-3):
+        return outputs
+    shifted = np.exp(outputs - outputs.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+class InferenceBackend:
+    """Base class for an inference backend
+
+    predict() has the signature of a Keras model's (plus leaf masks), so
+    callers can treat a backend as "the model".
+    """
+
+    name = None
+    # Model input, declared by each backend (read from the model file where possible)
+    input_size = (224, 224)  # (width, height)
+    input_dtype = np.float32
+    layout = "NHWC"
+    uses_masks = False
+    # Whether predict() may be called from several threads at once
+    thread_safe = True
+    # Model variants the backend can load
+    variants = ("float32",)
+    variant = "float32"
+    # Model file or directory, if any
+    path = None
+
+    @classmethod
+    def available(cls, variant=None):
+        """Whether the runtime is installed and the variant's model file exists"""
+        raise NotImplementedError
+
+    @classmethod
+    def _check_variant(cls, variant):
+        if variant not in cls.variants:
+            raise ValueError(f"The {cls.name} backend has no {variant} variant (choose from {', '.join(cls.variants)})")
+
+    def run(self, batch):
+        """Raw outputs for a batch already in the backend's input format"""
+        raise NotImplementedError
+
+    def prepare(self, processed_image):
+        """Convert float32 NHWC images in [0, 1] to this backend's input dtype and layout"""
+        batch = processed_image
+        if self.layout == "NCHW":
+            batch = batch.transpose(0, 3, 1, 2)
+        if self.input_dtype == np.uint8:
+            batch = np.rint(batch * 255)
+        elif self.input_dtype == np.int8:
+            batch = np.rint(batch * 255) - 128
+        return np.ascontiguousarray(batch, dtype=self.input_dtype)
+
+    def predict(self, processed_image, verbose=0, masks=None):
+        """Class probabilities (N, num_classes) for a batch of preprocessed images"""
+        return _softmax_if_needed(self.run(self.prepare(processed_image)))
+
+    def describe(self):
+        return {
+            'backend': self.name,
+            'input_size': self.input_size,
+            'input_dtype': np.dtype(self.input_dtype).name,
+            'layout': self.layout,
+            'variant': self.variant
+        }
+
+class HeuristicBackend(InferenceBackend):
+    """The built-in color-statistics classifier"""
+
+    name = "heuristic"
+    uses_masks = True
+
+    def __init__(self, variant=None):
+        from model_utils import SimplePlantClassifier
+        self.classifier = SimplePlantClassifier()
+
+    @classmethod
+    def available(cls, variant=None):
+        return True
+
+    def predict(self, processed_image, verbose=0, masks=None):
+        return self.classifier.predict(processed_image, verbose=verbose, masks=masks)
+
+class SavedModelBackend(InferenceBackend):
+    """TensorFlow SavedModel directory or Keras model file"""
+
+    name = "savedmodel"
+
+    def __init__(self, path=SAVEDMODEL_PATH, variant=None):
+        self._check_variant(variant or MODEL_VARIANT)
+        import tensorflow as tf
+
+        self.path = path
+        if INFERENCE_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+        self.model = tf.keras.models.load_model(path, compile=False)
+        _, height, width, _ = self.model.input_shape
+        self.input_size = (width or 224, height or 224)
+
+    @classmethod
+    def available(cls, variant=None):
+        return (
+            (variant or MODEL_VARIANT) in cls.variants
+            and module_available("tensorflow") and os.path.exists(SAVEDMODEL_PATH)
+        )
+
+    def run(self, batch):
+        return self.model(batch, training=False).numpy()
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite flatbuffer; tflite_runtime is preferred since it is far smaller than TensorFlow"""
+
+    name = "tflite"
+    variants = MODEL_VARIANTS
+    # An Interpreter must not be used by two threads at once; run() serializes calls
+    thread_safe = False
+
+    def __init__(self, path=None, variant=None):
+        self.variant = variant or MODEL_VARIANT
+        self._check_variant(self.variant)
+        self.path = path or variant_path(TFLITE_MODEL_PATH, self.variant)
+        if module_available("tflite_runtime"):
+            from tflite_runtime.interpreter import Interpreter
+        else:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=self.path, num_threads=INFERENCE_THREADS or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        _, height, width, _ = self.input_detail['shape']
+        self.input_size = (int(width), int(height))
+        self.input_dtype = self.input_detail['dtype']
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls, variant=None):
+        return (
+            (module_available("tflite_runtime") or module_available("tensorflow"))
+            and os.path.exists(variant_path(TFLITE_MODEL_PATH, variant))
+        )
+
+    def prepare(self, processed_image):
+        scale, zero_point = self.input_detail['quantization']
+        if scale and self.input_dtype in (np.uint8, np.int8):
+            # Quantized input: map [0, 1] through the model's own quantization parameters
+            batch = np.rint(processed_image / scale + zero_point)
+            info = np.iinfo(self.input_dtype)
+            return np.clip(batch, info.min, info.max).astype(self.input_dtype)
+        return super().prepare(processed_image)
+
+    def run(self, batch):
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_detail['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input_detail['index'], batch)
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self.output_detail['index'])
+        scale, zero_point = self.output_detail['quantization']
+        if scale:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+class ONNXBackend(InferenceBackend):
+    """ONNX Runtime with the CPU execution provider"""
+
+    name = "onnx"
+
+    _ONNX_DTYPES = {
+        'tensor(float)': np.float32,
+        'tensor(float16)': np.float16,
+        'tensor(uint8)': np.uint8,
+        'tensor(int8)': np.int8
+    }
+
+    variants = MODEL_VARIANTS
+
+    def __init__(self, path=None, variant=None):
+        self.variant = variant or MODEL_VARIANT
+        self._check_variant(self.variant)
+        self.path = path or variant_path(ONNX_MODEL_PATH, self.variant)
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if INFERENCE_THREADS:
+            options.intra_op_num_threads = INFERENCE_THREADS
+        self.session = onnxruntime.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = self._ONNX_DTYPES.get(model_input.type, np.float32)
+        shape = model_input.shape
+        # Channels-first models have 3 in position 1 (other dimensions may be symbolic)
+        self.layout = "NCHW" if shape[1] == 3 else "NHWC"
+        height, width = shape[2:4] if self.layout == "NCHW" else shape[1:3]
+        self.input_size = (
+            width if isinstance(width, int) else 224,
+            height if isinstance(height, int) else 224
+        )
+
+    @classmethod
+    def available(cls, variant=None):
+        return module_available("onnxruntime") and os.path.exists(variant_path(ONNX_MODEL_PATH, variant))
+
+    def run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+INFERENCE_BACKENDS = {
+    HeuristicBackend.name: HeuristicBackend,
+    SavedModelBackend.name: SavedModelBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    ONNXBackend.name: ONNXBackend
+}
+
+def create_backend(name=None, variant=None):
+    """Instantiate the configured backend and model variant
+
+    A backend named explicitly must load (errors propagate). In "auto" mode,
+    backends with the variant available are tried in AUTO_BACKEND_ORDER and
+    one that fails to load is skipped.
+    """
+    name = name or INFERENCE_BACKEND
+    variant = variant or MODEL_VARIANT
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}' (choose from {', '.join(MODEL_VARIANTS)})")
+    if name != "auto":
+        if name not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{name}' (choose from {', '.join(INFERENCE_BACKENDS)})")
+        return INFERENCE_BACKENDS[name](variant=variant)
+
+    for candidate in AUTO_BACKEND_ORDER:
+        backend = INFERENCE_BACKENDS[candidate]
+        if not backend.available(variant):
+            continue
+        if backend is HeuristicBackend:
+            print(f"Warning: no inference backend could load model variant '{variant}'; using the {HeuristicBackend.name} backend")
+        try:
+            return backend(variant=variant)
+        except Exception as e:
+            print(f"Inference backend {candidate} failed to load, trying the next one: {str(e)}")
+    print(f"Warning: no inference backend could load model variant '{variant}'; using the {HeuristicBackend.name} backend")
+    return HeuristicBackend()
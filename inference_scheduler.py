@@ -0,0 +1,202 @@
+"""
+Micro-batching inference scheduler shared by all sessions
+
+Every Streamlit session runs its script on its own thread, so concurrent
+analyses would each run a single-image forward pass and compete for the CPU.
+Instead, sessions share one model behind an InferenceScheduler: requests are
+queued, a worker thread collects them into a micro-batch (up to
+MAX_BATCH_SIZE images, waiting at most BATCH_WAIT_MS after the oldest
+request), runs one batched forward pass and hands each request its rows
+through a future.
+
+The scheduler has the model interface (predict, input_size, uses_masks,
+describe), so predict_disease, test-time augmentation and lesion scans use it
+unchanged. When more than MAX_QUEUED_IMAGES images are waiting, new requests
+are rejected with SchedulerOverloaded instead of queueing without bound.
+
+Batching is on unless AGRICARE_INFERENCE_BATCHING=0.
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from instrumentation import INSTRUMENTATION_ENABLED, REGISTRY
+
+INFERENCE_BATCHING = os.environ.get("AGRICARE_INFERENCE_BATCHING", "1") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("AGRICARE_MAX_BATCH_SIZE", "16"))
+BATCH_WAIT_MS = float(os.environ.get("AGRICARE_BATCH_WAIT_MS", "10"))
+MAX_QUEUED_IMAGES = int(os.environ.get("AGRICARE_MAX_QUEUED_IMAGES", "128"))
+
+# Seconds a caller waits for its result
+REQUEST_TIMEOUT = 60
+
+class SchedulerOverloaded(Exception):
+    """Raised when the inference queue is full"""
+
+class _Request:
+    __slots__ = ("images", "masks", "future", "enqueued")
+
+    def __init__(self, images, masks):
+        self.images = images
+        self.masks = masks
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class InferenceScheduler:
+    """Queue of inference requests served in micro-batches by one worker thread"""
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, batch_wait_ms=BATCH_WAIT_MS,
+                 max_queued_images=MAX_QUEUED_IMAGES):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_queued_images = max_queued_images
+
+        self._queue = deque()
+        self._queued_images = 0
+        self._condition = threading.Condition()
+        self._worker = None
+
+        self.requests_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.batch_sizes = Counter()
+        self.max_queue_depth = 0
+
+    @property
+    def input_size(self):
+        return self.model.input_size
+
+    @property
+    def uses_masks(self):
+        return getattr(self.model, "uses_masks", False)
+
+    def describe(self):
+        return {**self.model.describe(), 'batching': True}
+
+    def submit(self, processed_image, masks=None):
+        """Queue a batch of preprocessed images; returns a future of their probabilities
+
+        Raises SchedulerOverloaded if the queue is full.
+        """
+        if self.uses_masks and masks is None:
+            from model_utils import segment_leaf
+            # Segment on the caller's thread, in parallel with other sessions
+            masks = segment_leaf(processed_image)
+        request = _Request(processed_image, masks if self.uses_masks else None)
+
+        with self._condition:
+            if self._queued_images + len(processed_image) > self.max_queued_images:
+                self.rejected_total += 1
+                raise SchedulerOverloaded("Too many analyses are running right now, please try again in a moment")
+            self._queue.append(request)
+            self._queued_images += len(processed_image)
+            self.requests_total += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued_images)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._serve, name="inference-scheduler", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return request.future
+
+    def predict(self, processed_image, verbose=0, masks=None):
+        """Probabilities for a batch, computed together with other queued requests"""
+        return self.submit(processed_image, masks).result(timeout=REQUEST_TIMEOUT)
+
+    def _next_batch(self):
+        """Wait for requests and collect a micro-batch of them"""
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0].enqueued + self.batch_wait
+            batch = [self._queue.popleft()]
+            size = len(batch[0].images)
+            while size < self.max_batch_size:
+                if not self._queue:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                    continue
+                if size + len(self._queue[0].images) > self.max_batch_size:
+                    break
+                request = self._queue.popleft()
+                batch.append(request)
+                size += len(request.images)
+            self._queued_images -= size
+            return batch, size
+
+    def _serve(self):
+        while True:
+            batch, size = self._next_batch()
+            try:
+                self._run_batch(batch, size)
+            except Exception as e:
+                # Whatever failed, the worker keeps serving and no caller is left waiting
+                print(f"Inference batch failed: {str(e)}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _run_batch(self, batch, size):
+        start = time.perf_counter()
+        images = np.concatenate([request.images for request in batch])
+        masks = np.concatenate([request.masks for request in batch]) if self.uses_masks else None
+        probabilities = self.model.predict(images, verbose=0, masks=masks)
+
+        offset = 0
+        for request in batch:
+            count = len(request.images)
+            request.future.set_result(probabilities[offset:offset + count])
+            offset += count
+
+        with self._condition:
+            self.batches_total += 1
+            self.batch_sizes[size] += 1
+        if INSTRUMENTATION_ENABLED:
+            REGISTRY.observe("inference_scheduler.batch", time.perf_counter() - start)
+            for request in batch:
+                REGISTRY.observe("inference_scheduler.queue_wait", start - request.enqueued)
+
+    def metrics(self):
+        """Counters for monitoring"""
+        with self._condition:
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+            images = sum(size * count for size, count in batch_sizes.items())
+            return {
+                "queue_depth": self._queued_images,
+                "max_queue_depth": self.max_queue_depth,
+                "requests_total": self.requests_total,
+                "rejected_total": self.rejected_total,
+                "batches_total": self.batches_total,
+                "mean_batch_size": images / self.batches_total if self.batches_total else 0.0,
+                "batch_sizes": batch_sizes
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_inference_scheduler():
+    """Process-wide scheduler around the configured model, loaded on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from model_utils import load_model
+                _scheduler = InferenceScheduler(load_model())
+    return _scheduler
+
+def scheduler_metrics():
+    """Metrics of the process-wide scheduler, or None if it hasn't been started"""
+    return _scheduler.metrics() if _scheduler is not None else None
+
+def load_serving_model():
+    """Model for a session: the shared scheduler, or a model of its own when batching is off"""
+    if INFERENCE_BATCHING:
+        return get_inference_scheduler()
+    from model_utils import load_model
+    return load_model()
@@ -0,0 +1,186 @@
+"""
+Lightweight timing instrumentation
+
+Functions decorated with @timed() and blocks wrapped in `with timer(name):`
+record their duration into a per-name histogram with fixed buckets. The
+histograms can be inspected in the admin panel or written to a local file in
+the Prometheus text exposition format (METRICS_FILE), e.g. for node_exporter's
+textfile collector.
+
+Instrumentation is off unless AGRICARE_INSTRUMENTATION=1. When it is off,
+@timed() returns the function unchanged and timer() is a shared no-op
+context manager, so there is no per-call overhead.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from storage import write_bytes_atomic
+
+INSTRUMENTATION_ENABLED = os.environ.get("AGRICARE_INSTRUMENTATION", "0") == "1"
+
+METRICS_FILE = os.environ.get("AGRICARE_METRICS_FILE", "metrics.prom")
+
+# Minimum seconds between automatic exports to METRICS_FILE
+EXPORT_INTERVAL = 60
+
+# Upper bounds of the histogram buckets, in seconds (the last bucket is +Inf)
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+METRIC_NAME = "agricare_duration_seconds"
+
+class Histogram:
+    """Count, sum, max and bucketed distribution of durations"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def clear(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation within its bucket"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for position, bucket_count in enumerate(self.counts):
+                if seen + bucket_count >= rank and bucket_count:
+                    lower = self.buckets[position - 1] if position > 0 else 0.0
+                    upper = self.buckets[position] if position < len(self.buckets) else self.max
+                    # The observed maximum bounds every quantile
+                    upper = min(upper, self.max)
+                    lower = min(lower, upper)
+                    return lower + (upper - lower) * (rank - seen) / bucket_count
+                seen += bucket_count
+            return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "max_ms": self.max * 1000,
+            "total_s": self.total
+        }
+
+class MetricsRegistry:
+    """Histograms by name"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def summaries(self):
+        """{name: summary} of histograms with observations, sorted by total time spent"""
+        with self._lock:
+            items = list(self._histograms.items())
+        summaries = {name: histogram.summary() for name, histogram in items if histogram.count}
+        return dict(sorted(summaries.items(), key=lambda item: item[1]["total_s"], reverse=True))
+
+    def reset(self):
+        """Clear every histogram (in place, since decorated functions hold on to theirs)"""
+        with self._lock:
+            histograms = list(self._histograms.values())
+        for histogram in histograms:
+            histogram.clear()
+
+    def prometheus_text(self):
+        """All histograms in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in instrumented functions and blocks",
+            f"# TYPE {METRIC_NAME} histogram"
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+        for name, histogram in items:
+            with histogram._lock:
+                counts = list(histogram.counts)
+                count, total = histogram.count, histogram.total
+            label = f'name="{name}"'
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{METRIC_NAME}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{label}}} {total}")
+            lines.append(f"{METRIC_NAME}_count{{{label}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=METRICS_FILE):
+        """Write the Prometheus text to a file, replacing it atomically"""
+        write_bytes_atomic(path, self.prometheus_text().encode('utf-8'))
+        self._last_export = time.monotonic()
+
+    def maybe_export(self, path=METRICS_FILE, interval=EXPORT_INTERVAL):
+        """Export if the last export is older than `interval` seconds"""
+        if time.monotonic() - self._last_export >= interval:
+            self.export(path)
+
+REGISTRY = MetricsRegistry()
+
+_DISABLED_TIMER = nullcontext()
+
+@contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start)
+
+def timer(name):
+    """Context manager recording the duration of a block under `name`"""
+    if not INSTRUMENTATION_ENABLED:
+        return _DISABLED_TIMER
+    return _timer(name)
+
+def timed(name=None):
+    """Decorator recording each call's duration, by default as module.function"""
+    def decorate(func):
+        if not INSTRUMENTATION_ENABLED:
+            return func
+        metric = name or f"{func.__module__}.{func.__qualname__}"
+        histogram = REGISTRY.histogram(metric)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
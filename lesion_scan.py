@@ -0,0 +1,169 @@
+"""
+Tiled high-resolution lesion scanning
+
+preprocess_image shrinks a photo to 224x224, which erases small lesions. A
+scan instead covers the photo with overlapping model-sized tiles:
+
+- The photo is resized once, so that the tile grid fits in the tile budget
+  (never upscaled), and the tiles are strided views into that one array.
+- The leaf is segmented once over the whole scanned image; tile masks are
+  views into it.
+- Rows of tiles are scored as batches on a thread pool (NumPy releases the
+  GIL for the heavy work). Models that can't be called from several threads
+  (see InferenceBackend.thread_safe) score all tiles as one batch instead.
+
+A lesion on any part of the leaf should decide the verdict, so when the most
+diseased leaf tiles score above LESION_TILE_THRESHOLD their mean is the
+verdict; otherwise it is the leaf-weighted mean over all tiles. Per-tile
+disease scores are also returned as a heatmap overlay.
+"""
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from instrumentation import timed
+from model_utils import CLASS_NAMES, MIN_LEAF_FRACTION, clean_class_name, segment_leaf
+
+# Tile side when the model doesn't declare an input size
+TILE_SIZE = 224
+TILE_OVERLAP = 0.25
+
+# Most tiles scored per image; larger photos are scanned at a lower resolution
+TILE_BUDGET = int(os.environ.get("AGRICARE_TILE_BUDGET", "48"))
+TILE_WORKERS = int(os.environ.get("AGRICARE_TILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Photos whose sides are both at least this large are worth scanning
+MIN_SCAN_SIDE = 2 * TILE_SIZE
+
+# Segmentation stride over the whole scanned image
+SCAN_SEGMENTATION_STRIDE = 2
+
+# Share of leaf tiles (at least one) forming the "most diseased" group
+TOP_TILE_FRACTION = 0.1
+LESION_TILE_THRESHOLD = 0.5
+
+HEALTHY_COLUMNS = np.array(['healthy' in name.lower() for name in CLASS_NAMES])
+
+_tile_executor = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile-scan")
+
+def _tile_count(length, stride, tile_size):
+    return max(1, math.ceil((length - tile_size) / stride) + 1)
+
+def plan_scan(width, height, tile_budget=None, overlap=TILE_OVERLAP, tile_size=TILE_SIZE):
+    """Scan size (width, height), tile grid (columns, rows) and tile stride for a photo
+
+    The scan size is the photo scaled (down only) so the grid fits in the
+    budget, adjusted so tiles end exactly at the edges; the aspect ratio
+    changes by at most half a stride.
+    """
+    tile_budget = tile_budget or TILE_BUDGET
+    stride = max(1, round(tile_size * (1 - overlap)))
+    scale = 1.0
+    while True:
+        columns = _tile_count(width * scale, stride, tile_size)
+        rows = _tile_count(height * scale, stride, tile_size)
+        if columns * rows <= tile_budget or (columns == 1 and rows == 1):
+            break
+        scale *= min(0.95, math.sqrt(tile_budget / (columns * rows)))
+    size = (tile_size + stride * (columns - 1), tile_size + stride * (rows - 1))
+    return size, (columns, rows), stride
+
+def should_scan(image):
+    """Whether a photo is large enough for a tiled scan to see more than a single frame"""
+    return min(image.size) >= MIN_SCAN_SIDE
+
+def _tile_views(array, stride, tile_size):
+    """(rows, columns, tile_size, tile_size, ...) strided views of an (H, W, ...) array"""
+    window = (tile_size, tile_size) + array.shape[2:]
+    views = np.lib.stride_tricks.sliding_window_view(array, window)[::stride, ::stride]
+    # Drop the singleton window axes for the trailing dimensions
+    return views.reshape(views.shape[:2] + window)
+
+def _score_row(model, tiles, masks):
+    return model.predict(tiles, verbose=0, masks=masks)
+
+def _disease_heatmap(image, scores, stride, tile_size, alpha=0.5):
+    """uint8 RGB scan image with tile disease scores (rows, columns) blended in red"""
+    height, width = image.shape[:2]
+    # Average the scores of the overlapping tiles on a grid of stride-sized cells
+    cells = np.zeros((math.ceil(height / stride), math.ceil(width / stride)), dtype=np.float32)
+    counts = np.zeros_like(cells)
+    span = math.ceil(tile_size / stride)
+    for row, column in np.ndindex(scores.shape):
+        cells[row:row + span, column:column + span] += scores[row, column]
+        counts[row:row + span, column:column + span] += 1
+    cells /= np.maximum(counts, 1)
+
+    heat = Image.fromarray((cells * 255).astype(np.uint8)).resize((width, height), Image.Resampling.BILINEAR)
+    weight = (np.asarray(heat, dtype=np.float32) / 255.0 * alpha)[..., None]
+    red = np.array([255.0, 40.0, 40.0], dtype=np.float32)
+    blended = image * 255 * (1 - weight) + red * weight
+    return blended.clip(0, 255).astype(np.uint8)
+
+@timed()
+def scan_image(model, image, tile_budget=None):
+    """Scan a PIL image tile by tile
+
+    Returns a dict with `predictions` (clean class name -> probability, like
+    predict_disease), `heatmap` (uint8 RGB overlay at scan resolution),
+    `tile_scores` (disease score per tile, rows x columns), `tiles` (number
+    of tiles scored) and `scan_size` (width, height).
+    """
+    try:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # Tiles are the model's (square) input size
+        tile_size = getattr(model, "input_size", (TILE_SIZE, TILE_SIZE))[0]
+        size, (columns, rows), stride = plan_scan(*image.size, tile_budget=tile_budget, tile_size=tile_size)
+        # reducing_gap lets Pillow shrink by an integer factor first, which is much faster on large photos
+        scan = np.asarray(image.resize(size, Image.Resampling.BILINEAR, reducing_gap=3.0), dtype=np.float32) / 255.0
+
+        masks = segment_leaf(scan[None], stride=SCAN_SEGMENTATION_STRIDE)[0]
+        tiles = _tile_views(scan, stride, tile_size)
+        tile_masks = _tile_views(masks, stride, tile_size)
+        coverage = tile_masks.mean(axis=(2, 3))
+        on_leaf = coverage >= MIN_LEAF_FRACTION
+        if not on_leaf.any():
+            on_leaf[:] = True
+            coverage[:] = 1.0
+
+        # Off-leaf tiles are scored on the whole tile; they are left out of the verdict anyway
+        score_masks = tile_masks | ~on_leaf[:, :, None, None]
+        if getattr(model, "thread_safe", True):
+            futures = [
+                _tile_executor.submit(_score_row, model, tiles[row], score_masks[row])
+                for row in range(rows)
+            ]
+            probabilities = np.stack([future.result() for future in futures])
+        else:
+            flat_tiles = tiles.reshape((rows * columns,) + tiles.shape[2:])
+            flat_masks = score_masks.reshape((rows * columns,) + score_masks.shape[2:])
+            probabilities = _score_row(model, flat_tiles, flat_masks).reshape(rows, columns, -1)
+
+        disease_scores = probabilities[..., ~HEALTHY_COLUMNS].sum(axis=-1)
+        leaf_probabilities = probabilities[on_leaf]
+        leaf_scores = disease_scores[on_leaf]
+        top_count = max(1, math.ceil(TOP_TILE_FRACTION * len(leaf_scores)))
+        top_tiles = np.argsort(leaf_scores)[-top_count:]
+        if leaf_scores[top_tiles].mean() > LESION_TILE_THRESHOLD:
+            verdict = leaf_probabilities[top_tiles].mean(axis=0)
+        else:
+            verdict = np.average(leaf_probabilities, axis=0, weights=coverage[on_leaf])
+
+        predictions = {}
+        for i, class_name in enumerate(CLASS_NAMES):
+            predictions[clean_class_name(class_name)] = float(verdict[i])
+
+        return {
+            "predictions": predictions,
+            "heatmap": _disease_heatmap(scan, np.where(on_leaf, disease_scores, 0.0), stride, tile_size),
+            "tile_scores": disease_scores,
+            "tiles": rows * columns,
+            "scan_size": size
+        }
+
+    except Exception as e:
+        raise Exception(f"Failed to scan image: {str(e)}")
@@ -0,0 +1,228 @@
+"""
+Columnar archive tier for older plant activity logs
+
+Logs older than ARCHIVE_AFTER_DAYS move out of plants.json into compressed
+per-user, per-month segments (user_data/<user>/log_archive/YYYY-MM.npz). Each
+segment stores one array per column: dates as integer days plus seconds of
+day, and string fields dictionary-encoded as integer codes into a table of
+distinct values. Readers load only the columns they ask for.
+
+Only logs the archive reads back unchanged are archived; entries with fields
+it has no column for, a non-integer plant_id or a date in another format stay
+in plants.json.
+"""
+import io
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from auth_utils import get_user_data_path
+from storage import file_lock, write_bytes_atomic
+
+ARCHIVE_DIR = "log_archive"
+ARCHIVE_AFTER_DAYS = 90
+
+EPOCH = datetime(1970, 1, 1)
+
+# Log date strings are written in one of these styles; the style is stored per
+# row so archived dates read back exactly as written. New styles go at the end,
+# existing segments refer to them by index.
+DATE_STYLES = [
+    "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d"
+]
+
+DICTIONARY_COLUMNS = ["activity", "notes", "disease", "plant_name"]
+LOG_COLUMNS = ["plant_id", "date"] + DICTIONARY_COLUMNS + ["confidence"]
+
+def _parse_log_date(value):
+    """(datetime, style index) for a log date string, or None if it can't be archived"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    for style, date_format in enumerate(DATE_STYLES):
+        if parsed.tzinfo is None and parsed.strftime(date_format) == value:
+            return parsed, style
+    return None
+
+def _archivable(log):
+    """Whether a log entry reads back from the archive exactly as it is"""
+    if not set(log) <= set(LOG_COLUMNS):
+        return False
+    plant_id = log.get("plant_id")
+    if plant_id is not None and (type(plant_id) is not int or plant_id < 0):
+        return False
+    confidence = log.get("confidence")
+    if confidence is not None and type(confidence) not in (int, float):
+        return False
+    return all(log.get(column) is None or isinstance(log[column], str) for column in DICTIONARY_COLUMNS)
+
+def _log_identity(log):
+    """Key identifying a log entry; to the second, as older segments kept dates"""
+    moment, _ = _parse_log_date(log.get("date"))
+    return (log.get("plant_id"), log.get("activity"), moment.replace(microsecond=0), log.get("notes"))
+
+def _segment_key(moment):
+    return moment.strftime("%Y-%m")
+
+def get_archive_dir(username):
+    return get_user_data_path(username, ARCHIVE_DIR)
+
+def _segment_path(username, key):
+    return os.path.join(get_archive_dir(username), f"{key}.npz")
+
+def encode_log_segment(logs):
+    """Encode archivable logs into a dict of column arrays"""
+    parsed = [_parse_log_date(log.get("date")) for log in logs]
+    moments = [moment for moment, _ in parsed]
+
+    columns = {
+        "plant_id": np.array([log.get("plant_id") if log.get("plant_id") is not None else -1 for log in logs], dtype=np.int64),
+        "day": np.array([(moment - EPOCH).days for moment in moments], dtype=np.int32),
+        "second": np.array([(moment - EPOCH).seconds for moment in moments], dtype=np.int32),
+        "microsecond": np.array([moment.microsecond for moment in moments], dtype=np.int32),
+        "date_style": np.array([style for _, style in parsed], dtype=np.uint8),
+        "confidence": np.array(
+            [log["confidence"] if log.get("confidence") is not None else np.nan for log in logs],
+            dtype=np.float64
+        )
+    }
+
+    for column in DICTIONARY_COLUMNS:
+        values = {}
+        codes = np.empty(len(logs), dtype=np.int32)
+        for position, log in enumerate(logs):
+            value = log.get(column)
+            # Code -1 marks a missing value
+            codes[position] = -1 if value is None else values.setdefault(str(value), len(values))
+        columns[f"{column}_codes"] = codes
+        columns[f"{column}_values"] = np.array(list(values), dtype=str) if values else np.array([], dtype="<U1")
+
+    return columns
+
+def _decode_dictionary(arrays, column):
+    codes = arrays[f"{column}_codes"]
+    values = arrays[f"{column}_values"].astype(object)
+    decoded = np.empty(len(codes), dtype=object)
+    present = codes >= 0
+    decoded[present] = values[codes[present]]
+    return decoded
+
+def _decode_dates(arrays):
+    days = arrays["day"]
+    seconds = arrays["second"]
+    styles = arrays["date_style"]
+    # Segments written before microseconds were kept have no such array
+    microseconds = arrays.get("microsecond", np.zeros_like(days))
+    return np.array([
+        (EPOCH + timedelta(days=int(day), seconds=int(second), microseconds=int(microsecond)))
+        .strftime(DATE_STYLES[style])
+        for day, second, microsecond, style in zip(days, seconds, microseconds, styles)
+    ], dtype=object)
+
+def _required_arrays(columns):
+    """Stored array names needed to decode the requested log columns"""
+    names = []
+    for column in columns:
+        if column == "date":
+            names += ["day", "second", "microsecond", "date_style"]
+        elif column in DICTIONARY_COLUMNS:
+            names += [f"{column}_codes", f"{column}_values"]
+        else:
+            names.append(column)
+    return names
+
+def read_segment(path, columns=LOG_COLUMNS):
+    """Decode the requested columns of one segment; only those arrays are decompressed"""
+    decoded = {}
+    with np.load(path, allow_pickle=False) as segment:
+        arrays = {name: segment[name] for name in _required_arrays(columns) if name in segment.files}
+    for column in columns:
+        if column == "date":
+            decoded["date"] = _decode_dates(arrays)
+        elif column in DICTIONARY_COLUMNS:
+            decoded[column] = _decode_dictionary(arrays, column)
+        else:
+            decoded[column] = arrays[column]
+    return decoded
+
+def _segment_records(decoded):
+    """Turn decoded columns back into log dicts, leaving out missing values"""
+    columns = list(decoded)
+    length = len(decoded[columns[0]]) if columns else 0
+    for position in range(length):
+        record = {}
+        for column in columns:
+            value = decoded[column][position]
+            if column == "plant_id":
+                value = None if value < 0 else int(value)
+                record[column] = value
+            elif column == "confidence":
+                if not np.isnan(value):
+                    record[column] = float(value)
+            elif value is not None:
+                record[column] = value
+        yield record
+
+def list_segments(username, start=None, end=None):
+    """Archive segment keys (YYYY-MM) for a user, oldest first, optionally limited to a range"""
+    archive_dir = get_archive_dir(username)
+    if not os.path.isdir(archive_dir):
+        return []
+    keys = sorted(name[:-4] for name in os.listdir(archive_dir) if name.endswith(".npz"))
+    return [key for key in keys if (start is None or key >= start) and (end is None or key <= end)]
+
+def read_log_columns(username, columns, start=None, end=None):
+    """Concatenate the requested columns across a user's segments in the month range"""
+    parts = {column: [] for column in columns}
+    for key in list_segments(username, start, end):
+        decoded = read_segment(_segment_path(username, key), columns)
+        for column in columns:
+            parts[column].append(decoded[column])
+    return {
+        column: np.concatenate(arrays) if arrays else np.array([], dtype=object)
+        for column, arrays in parts.items()
+    }
+
+def iter_archived_logs(username, start=None, end=None):
+    """Yield archived log entries oldest segment first, one segment in memory at a time"""
+    for key in list_segments(username, start, end):
+        yield from _segment_records(read_segment(_segment_path(username, key)))
+
+def _write_segment(path, logs):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **encode_log_segment(logs))
+    write_bytes_atomic(path, buffer.getvalue())
+
+def archive_old_logs(username, logs, now=None, after_days=ARCHIVE_AFTER_DAYS):
+    """Move logs older than after_days into monthly segments and return the ones to keep hot
+
+    Logs that can't be archived exactly (see _archivable) always stay hot.
+    """
+    cutoff = (now or datetime.now()) - timedelta(days=after_days)
+    hot = []
+    by_month = {}
+    for log in logs:
+        parsed = _parse_log_date(log.get("date"))
+        if parsed is None or parsed[0] >= cutoff or not _archivable(log):
+            hot.append(log)
+        else:
+            by_month.setdefault(_segment_key(parsed[0]), []).append(log)
+
+    for key, month_logs in by_month.items():
+        path = _segment_path(username, key)
+        # Held across the merge so concurrent archivers don't drop each other's entries
+        with file_lock(path):
+            if os.path.exists(path):
+                # Merge into the existing segment, skipping entries it already holds
+                # (e.g. history that came back in through an import)
+                archived = list(_segment_records(read_segment(path)))
+                seen = {_log_identity(log) for log in archived}
+                month_logs = archived + [log for log in month_logs if _log_identity(log) not in seen]
+            _write_segment(path, month_logs)
+
+    return hot
@@ -1,9 +1,11 @@
 import numpy as np
 from PIL import Image
-import requests
 import os
-from io import BytesIO
 import random
+import threading
+import time
+from functools import lru_cache
+from instrumentation import timed
 
 # Plant disease class names
 CLASS_NAMES = [
@@ -47,6 +49,250 @@ CLASS_NAMES = [
     'Tomato___healthy'
 ]
 
+# Leaf segmentation: excess-green (ExG = 2g - r - b on chromaticity) marks leaf
+# tissue; yellow/brown lesion pixels count as leaf when they lie on or next to
+# green tissue, so soil and background aren't pulled in
+EXG_THRESHOLD = 0.1
+LESION_HUE_RANGE = (15.0, 75.0)  # degrees: brown through yellow
+LESION_MIN_SATURATION = 0.25
+MIN_VALUE = 0.12  # darker pixels are shadow
+CLOSING_RADIUS = 4
+OPENING_RADIUS = 1
+LESION_REACH = 6  # closing radius deciding which lesion pixels are enclosed by leaf
+
+# Below this leaf fraction the mask is unreliable and the whole frame is used
+MIN_LEAF_FRACTION = 0.05
+
+# Per-image time budget for segmentation; over budget, later calls segment at a
+# coarser stride (upsampled back to full resolution), and return to a finer one
+# once it fits again
+SEGMENTATION_BUDGET_MS = 15.0
+MAX_SEGMENTATION_STRIDE = 4
+# Weight of the latest call in the running segmentation cost estimate
+SEGMENTATION_COST_SMOOTHING = 0.2
+
+# Test-time augmentation: views per image (1 = off) and the time budget for
+# scoring them; views beyond what fits in the budget are skipped
+TTA_COUNT = int(os.environ.get("AGRICARE_TTA_COUNT", "1"))
+TTA_BUDGET_MS = float(os.environ.get("AGRICARE_TTA_BUDGET_MS", "150"))
+# Weight of the latest call in the running cost-per-view estimate
+TTA_COST_SMOOTHING = 0.2
+
+# (horizontal flip, vertical flip, rotation in degrees, brightness factor), in
+# the order they are used; the first is the original image
+TTA_VIEWS = [
+    (False, False, 0.0, 1.0),
+    (True, False, 0.0, 1.0),
+    (False, True, 0.0, 1.0),
+    (False, False, 8.0, 1.0),
+    (False, False, -8.0, 1.0),
+    (False, False, 0.0, 1.1),
+    (False, False, 0.0, 0.9),
+    (True, False, 4.0, 1.05),
+    (False, True, -4.0, 0.95)
+]
+
+def _window_counts(masks, radius, axis, pad_value):
+    """Number of True values in each length 2*radius+1 window along one axis (running sums)"""
+    pad = [(0, 0)] * 3
+    pad[axis] = (radius + 1, radius)
+    sums = np.pad(masks, pad, constant_values=pad_value).cumsum(axis=axis, dtype=np.int32)
+    size = 2 * radius + 1
+    upper = [slice(None)] * 3
+    lower = [slice(None)] * 3
+    upper[axis] = slice(size, None)
+    lower[axis] = slice(None, -size)
+    return sums[tuple(upper)] - sums[tuple(lower)]
+
+def dilate(masks, radius):
+    """Binary dilation of (N, H, W) masks by a square of side 2*radius+1 (separable)"""
+    for axis in (1, 2):
+        if radius > 0:
+            masks = _window_counts(masks, radius, axis, False) > 0
+    return masks
+
+def erode(masks, radius):
+    """Binary erosion by a square; borders are padded with True so they don't erode"""
+    for axis in (1, 2):
+        if radius > 0:
+            masks = _window_counts(masks, radius, axis, True) == 2 * radius + 1
+    return masks
+
+def _hue_saturation_value(images):
+    """HSV channels of (N, H, W, 3) RGB images in [0, 1]; hue in degrees"""
+    red, green, blue = images[..., 0], images[..., 1], images[..., 2]
+    # Elementwise over the channel planes; a reduction over a length-3 last axis is far slower
+    value = np.maximum(np.maximum(red, green), blue)
+    chroma = value - np.minimum(np.minimum(red, green), blue)
+    saturation = np.divide(chroma, value, out=np.zeros_like(value), where=value > 0)
+
+    safe_chroma = np.where(chroma > 0, chroma, 1.0)
+    hue = np.select(
+        [value == red, value == green],
+        [((green - blue) / safe_chroma) % 6, (blue - red) / safe_chroma + 2],
+        (red - green) / safe_chroma + 4
+    ) * 60.0
+    return hue, saturation, value
+
+# Stride segmentation currently runs at, to stay within SEGMENTATION_BUDGET_MS,
+# and the smoothed per-image cost scaled to stride 1 that it is chosen from
+_segmentation_state = {"stride": 1, "full_ms": None}
+_segmentation_lock = threading.Lock()
+
+def _record_segmentation_cost(per_image_ms, stride):
+    """Fold one call's cost into the estimate and pick the finest stride that fits the budget
+
+    Cost falls roughly with the number of pixels, i.e. with stride squared.
+    """
+    full_ms = per_image_ms * stride ** 2
+    with _segmentation_lock:
+        previous = _segmentation_state["full_ms"]
+        if previous is not None:
+            full_ms = SEGMENTATION_COST_SMOOTHING * full_ms + (1 - SEGMENTATION_COST_SMOOTHING) * previous
+        _segmentation_state["full_ms"] = full_ms
+        stride = 1
+        while full_ms / stride ** 2 > SEGMENTATION_BUDGET_MS and stride < MAX_SEGMENTATION_STRIDE:
+            stride *= 2
+        _segmentation_state["stride"] = stride
+
+@timed()
+def segment_leaf(processed_image, stride=None):
+    """Boolean foreground masks (N, H, W) for a batch of preprocessed images (N, H, W, 3) in [0, 1]
+
+    Vectorized over the batch. Images where too little leaf is found get an
+    all-True mask.
+    """
+    start = time.perf_counter()
+    adaptive = stride is None
+    stride = _segmentation_state["stride"] if adaptive else stride
+
+    images = processed_image[:, ::stride, ::stride, :]
+    totals = images[..., 0] + images[..., 1] + images[..., 2]
+    chromaticity = images / np.where(totals > 0, totals, 1.0)[..., None]
+    excess_green = 2 * chromaticity[..., 1] - chromaticity[..., 0] - chromaticity[..., 2]
+    hue, saturation, value = _hue_saturation_value(images)
+
+    bright = value > MIN_VALUE
+    green = (excess_green > EXG_THRESHOLD) & bright
+    lesion = (
+        (hue >= LESION_HUE_RANGE[0]) & (hue <= LESION_HUE_RANGE[1])
+        & (saturation > LESION_MIN_SATURATION) & bright
+    )
+
+    scale = max(1, stride)
+    # Opening drops isolated greenish pixels (noise, moss on soil) before they seed lesions
+    green = dilate(erode(green, OPENING_RADIUS), OPENING_RADIUS)
+    # Lesions count as leaf only where surrounded by green tissue (closing of the
+    # green mask), so brown soil along the leaf margin stays background
+    reach = max(1, LESION_REACH // scale)
+    enclosed = erode(dilate(green, reach), reach)
+    masks = green | (lesion & enclosed)
+    # Closing fills lesions and veins enclosed by leaf
+    closing = max(1, CLOSING_RADIUS // scale)
+    masks = erode(dilate(masks, closing), closing)
+
+    if stride > 1:
+        height, width = processed_image.shape[1:3]
+        masks = masks.repeat(stride, axis=1).repeat(stride, axis=2)[:, :height, :width]
+
+    too_small = masks.mean(axis=(1, 2)) < MIN_LEAF_FRACTION
+    masks[too_small] = True
+
+    if adaptive:
+        per_image_ms = (time.perf_counter() - start) * 1000 / max(1, len(processed_image))
+        _record_segmentation_cost(per_image_ms, stride)
+    return masks
+
+def mask_overlay(image_array, mask, tint=(255, 64, 160), alpha=0.45):
+    """uint8 RGB image with the background (outside the mask) tinted, for display"""
+    image = np.asarray(image_array, dtype=np.float32)
+    if image.max() <= 1.0:
+        image = image * 255
+    overlay = image.copy()
+    overlay[~mask] = (1 - alpha) * image[~mask] + alpha * np.array(tint, dtype=np.float32)
+    return overlay.clip(0, 255).astype(np.uint8)
+
+def leaf_color_features(processed_image, masks):
+    """Color statistics over the leaf pixels of each image, as arrays of length N
+
+    Means and standard deviations are masked reductions, so background pixels
+    don't contribute.
+    """
+    count = len(processed_image)
+    pixels = processed_image.reshape(count, -1, 3)
+    # (N, 1, P) @ (N, P, 3): masked sums as one batched matrix product
+    weights = masks.reshape(count, 1, -1).astype(np.float32)
+    counts = weights.sum(axis=2)
+    means = (weights @ pixels)[:, 0] / counts
+    squares = (weights @ (pixels * pixels))[:, 0] / counts
+    stds = np.sqrt(np.maximum(squares - means ** 2, 0)) * 255  # Convert back to 0-255 range
+    means = means * 255
+
+    return {
+        "mean_brightness": means.mean(axis=1),
+        "red_ratio": means[:, 0] / 255.0,
+        "green_ratio": means[:, 1] / 255.0,
+        "blue_ratio": means[:, 2] / 255.0,
+        # Standard deviation to detect spots/variations
+        "color_variation": stds[:, 1] + stds[:, 0],
+        "leaf_fraction": masks.mean(axis=(1, 2))
+    }
+
+@lru_cache(maxsize=16)
+def _rotation_indices(height, width, degrees):
+    """Source (rows, columns) for nearest-neighbour rotation about the centre, clamped at the edges"""
+    angle = np.deg2rad(degrees)
+    rows, columns = np.mgrid[:height, :width].astype(np.float32)
+    center_row, center_column = (height - 1) / 2, (width - 1) / 2
+    y, x = rows - center_row, columns - center_column
+    source_rows = np.rint(center_row + y * np.cos(angle) - x * np.sin(angle)).astype(np.intp)
+    source_columns = np.rint(center_column + y * np.sin(angle) + x * np.cos(angle)).astype(np.intp)
+    return source_rows.clip(0, height - 1), source_columns.clip(0, width - 1)
+
+def _augment(arrays, view, brighten):
+    """One augmented view of a batch (N, H, W, ...); brightness only when `brighten`"""
+    flip_horizontal, flip_vertical, degrees, brightness = view
+    if flip_horizontal:
+        arrays = arrays[:, :, ::-1]
+    if flip_vertical:
+        arrays = arrays[:, ::-1]
+    if degrees:
+        rows, columns = _rotation_indices(arrays.shape[1], arrays.shape[2], degrees)
+        arrays = arrays[:, rows, columns]
+    if brighten and brightness != 1.0:
+        arrays = np.clip(arrays * brightness, 0.0, 1.0)
+    return arrays
+
+def augment_batch(processed_image, masks, count):
+    """The first `count` TTA_VIEWS of a batch, stacked view-major into (count * N, ...)
+
+    The masks get the same geometric transforms as the images.
+    """
+    views = TTA_VIEWS[:count]
+    images = np.concatenate([_augment(processed_image, view, True) for view in views])
+    masks = np.concatenate([_augment(masks, view, False) for view in views])
+    return images, masks
+
+# Smoothed milliseconds to score one view of one image, for TTA_BUDGET_MS
+_tta_state = {"view_ms": None}
+_tta_lock = threading.Lock()
+
+def _record_tta_cost(view_ms):
+    """Fold one call's cost per view into the running estimate"""
+    with _tta_lock:
+        previous = _tta_state["view_ms"]
+        if previous is not None:
+            view_ms = TTA_COST_SMOOTHING * view_ms + (1 - TTA_COST_SMOOTHING) * previous
+        _tta_state["view_ms"] = view_ms
+
+def _tta_view_count(requested, images):
+    """Views that fit in the time budget, judged by the smoothed cost per view"""
+    view_ms = _tta_state["view_ms"]
+    count = min(requested, len(TTA_VIEWS))
+    if view_ms:
+        count = min(count, max(1, int(TTA_BUDGET_MS / (view_ms * images))))
+    return count
+
 class SimplePlantClassifier:
     """A simple plant disease classifier using image analysis"""
     
@@ -54,26 +300,28 @@ class SimplePlantClassifier:
         self.class_names = CLASS_NAMES
         random.seed(42)  # For consistent demo results
     
-    def predict(self, processed_image, verbose=0):
-        """Make a prediction based on image features"""
-        # Analyze image characteristics
-        image_array = processed_image[0] * 255  # Convert back to 0-255 range
-        
-        # Calculate basic image statistics
-        mean_brightness = np.mean(image_array)
-        green_channel = image_array[:, :, 1]  # Green channel for leaf analysis
-        red_channel = image_array[:, :, 0]
-        blue_channel = image_array[:, :, 2]
-        
-        # Calculate color ratios and variability
-        green_ratio = np.mean(green_channel) / 255.0
-        red_ratio = np.mean(red_channel) / 255.0
-        blue_ratio = np.mean(blue_channel) / 255.0
-        
-        # Calculate standard deviation to detect spots/variations
-        green_std = np.std(green_channel)
-        red_std = np.std(red_channel)
-        color_variation = green_std + red_std
+    def predict(self, processed_image, verbose=0, masks=None):
+        """Make a prediction for each image in the batch based on leaf color features
+        
+        Background pixels are excluded using `masks` (computed with
+        segment_leaf when not given). Returns an (N, num_classes) array.
+        """
+        from image_workers import leaf_features
+        if masks is None:
+            masks = segment_leaf(processed_image)
+        features = leaf_features(processed_image, masks)
+        return np.stack([
+            self._image_probabilities({name: values[i] for name, values in features.items()})
+            for i in range(len(processed_image))
+        ])
+    
+    def _image_probabilities(self, features):
+        """Probability distribution over classes for one image's features"""
+        mean_brightness = features["mean_brightness"]
+        green_ratio = features["green_ratio"]
+        red_ratio = features["red_ratio"]
+        blue_ratio = features["blue_ratio"]
+        color_variation = features["color_variation"]
         
         # More sensitive disease detection criteria
         brown_detection = (red_ratio > 0.35 and green_ratio < 0.65) or (red_ratio - green_ratio > 0.1)
@@ -156,27 +404,37 @@ class SimplePlantClassifier:
             # Fallback - equal distribution
             probabilities = np.ones(len(self.class_names)) / len(self.class_names)
         
-        return probabilities.reshape(1, -1)
+        return probabilities
 
-def load_model():
-    """Load the plant disease detection model"""
+@timed()
+def load_model(backend=None, variant=None):
+    """Load the plant disease detection model
+    
+    Returns an inference backend (see inference_backends), by default the one
+    and the model variant selected by AGRICARE_INFERENCE_BACKEND and
+    AGRICARE_MODEL_VARIANT.
+    """
+    from inference_backends import create_backend
     try:
-        # Return our simple classifier
-        model = SimplePlantClassifier()
-        return model
+        return create_backend(backend, variant)
         
     except Exception as e:
         raise Exception(f"Failed to load model: {str(e)}")
 
-def preprocess_image(image):
-    """Preprocess the image for model prediction"""
+@timed()
+def preprocess_image(image, input_size=(224, 224)):
+    """Preprocess the image for model prediction
+    
+    `input_size` is the model's (width, height); the result is float32 NHWC
+    in [0, 1], which the backend converts to its own input format.
+    """
     try:
         # Convert to RGB if necessary
         if image.mode != 'RGB':
             image = image.convert('RGB')
         
         # Resize image to model input size
-        image = image.resize((224, 224))
+        image = image.resize(tuple(input_size))
         
         # Convert to numpy array
         image_array = np.array(image)
@@ -192,11 +450,37 @@ def preprocess_image(image):
     except Exception as e:
         raise Exception(f"Failed to preprocess image: {str(e)}")
 
-def predict_disease(model, processed_image):
-    """Make disease prediction using the model"""
+@timed()
+def predict_disease(model, processed_image, masks=None, augmentations=None):
+    """Make disease prediction using the model
+    
+    `masks` are leaf masks from segment_leaf, for models that use them.
+    With `augmentations` (default TTA_COUNT) above 1, flipped, rotated and
+    brightened views are scored in one batch and their probabilities
+    averaged, as many as fit in TTA_BUDGET_MS.
+    """
     try:
+        requested = augmentations or TTA_COUNT
+        count = _tta_view_count(requested, len(processed_image))
+        if count > 1 and masks is None:
+            # Models that ignore masks still get a placeholder to transform
+            uses_masks = getattr(model, "uses_masks", True)
+            masks = segment_leaf(processed_image) if uses_masks else np.ones(processed_image.shape[:3], dtype=bool)
+        
+        start = time.perf_counter()
+        if count > 1:
+            images, view_masks = augment_batch(processed_image, masks, count)
+            predictions = model.predict(images, verbose=0, masks=view_masks)
+            predictions = predictions.reshape(count, len(processed_image), -1).mean(axis=0)
         # Make prediction
-        predictions = model.predict(processed_image, verbose=0)
+        elif masks is not None:
+            predictions = model.predict(processed_image, verbose=0, masks=masks)
+        else:
+            predictions = model.predict(processed_image, verbose=0)
+        if requested > 1:
+            # Single-view calls are timed as well, so after a slow spell the
+            # estimate comes back down and more views are used again
+            _record_tta_cost((time.perf_counter() - start) * 1000 / (count * len(processed_image)))
         
         # Get prediction probabilities
         prediction_probs = predictions[0]
@@ -228,11 +512,15 @@ def clean_class_name(class_name):
     else:
         return class_name.replace('_', ' ').title()
 
-def get_model_info():
+def get_model_info(model=None):
     """Get information about the loaded model"""
-    return {
+    width, height = model.input_size if model is not None else (224, 224)
+    info = {
         'name': 'Plant Disease Detection Model',
-        'input_shape': (224, 224, 3),
+        'input_shape': (height, width, 3),
         'num_classes': len(CLASS_NAMES),
         'classes': CLASS_NAMES
     }
+    if model is not None:
+        info.update(model.describe())
+    return info
@@ -0,0 +1,267 @@
+"""
+Salted, tunable password hashing
+
+Hashes are stored as self-describing strings, "<scheme>$<params>$<salt>$<hash>",
+so cost parameters can be raised later: a stored hash made with older or
+weaker parameters (including the legacy unsalted SHA-256 hex digests) still
+verifies, and needs_rehash() tells the login path to replace it.
+
+Cost parameters come from the environment (see PASSWORD_HASH_SCHEME,
+SCRYPT_N, PBKDF2_ITERATIONS). Running this module benchmarks the hashers on
+the current machine and prints the strongest settings that fit within
+LOGIN_LATENCY_BUDGET_MS.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+PASSWORD_HASH_SCHEME = os.environ.get("AGRICARE_PASSWORD_HASH_SCHEME", "scrypt")
+
+# scrypt: memory use is 128 * N * r bytes (16 MiB at the defaults)
+SCRYPT_N = int(os.environ.get("AGRICARE_SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.environ.get("AGRICARE_SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("AGRICARE_SCRYPT_P", 1))
+
+PBKDF2_ITERATIONS = int(os.environ.get("AGRICARE_PBKDF2_ITERATIONS", 600000))
+
+# Time a single password verification may take during login
+LOGIN_LATENCY_BUDGET_MS = float(os.environ.get("AGRICARE_LOGIN_LATENCY_BUDGET_MS", 250))
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Successful verifications remembered to skip re-hashing on repeated logins
+VERIFICATION_CACHE_SIZE = 1024
+VERIFICATION_CACHE_TTL = 15 * 60
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip("=")
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+class PasswordHasher:
+    """Base class for a password hashing scheme"""
+
+    scheme = None
+
+    def derive(self, password, salt):
+        """Raw derived key for a password and salt"""
+        raise NotImplementedError
+
+    def params(self):
+        """Cost parameters, encoded into the stored hash"""
+        raise NotImplementedError
+
+    @classmethod
+    def from_params(cls, params):
+        """Hasher configured with the parameters stored in a hash"""
+        raise NotImplementedError
+
+    def hash(self, password):
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self.derive(password, salt)
+        return f"{self.scheme}${self.params()}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def is_current(self, other):
+        """Whether a hasher read from a stored hash uses this scheme and parameters"""
+        return type(other) is type(self) and other.params() == self.params()
+
+class ScryptHasher(PasswordHasher):
+    scheme = "scrypt"
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        self.n, self.r, self.p = n, r, p
+
+    def derive(self, password, salt):
+        return hashlib.scrypt(
+            password.encode('utf-8'), salt=salt, n=self.n, r=self.r, p=self.p,
+            maxmem=256 * self.n * self.r + 1024 * 1024, dklen=HASH_BYTES
+        )
+
+    def params(self):
+        return f"n={self.n},r={self.r},p={self.p}"
+
+    @classmethod
+    def from_params(cls, params):
+        values = dict(item.split("=") for item in params.split(","))
+        return cls(n=int(values["n"]), r=int(values["r"]), p=int(values["p"]))
+
+class PBKDF2Hasher(PasswordHasher):
+    scheme = "pbkdf2_sha256"
+
+    def __init__(self, iterations=PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def derive(self, password, salt):
+        return hashlib.pbkdf2_hmac("sha256", password.encode('utf-8'), salt, self.iterations, dklen=HASH_BYTES)
+
+    def params(self):
+        return f"i={self.iterations}"
+
+    @classmethod
+    def from_params(cls, params):
+        values = dict(item.split("=") for item in params.split(","))
+        return cls(iterations=int(values["i"]))
+
+PASSWORD_HASHERS = {
+    ScryptHasher.scheme: ScryptHasher,
+    PBKDF2Hasher.scheme: PBKDF2Hasher
+}
+
+if not hasattr(hashlib, "scrypt"):
+    # Python built against an OpenSSL without scrypt
+    del PASSWORD_HASHERS[ScryptHasher.scheme]
+
+def get_default_hasher():
+    """Hasher for new hashes, from the configured scheme and cost parameters"""
+    scheme = PASSWORD_HASH_SCHEME if PASSWORD_HASH_SCHEME in PASSWORD_HASHERS else PBKDF2Hasher.scheme
+    return PASSWORD_HASHERS[scheme]()
+
+def is_legacy_hash(encoded):
+    """Unsalted SHA-256 hex digests from before salted hashing"""
+    return "$" not in encoded and len(encoded) == 64
+
+def _parse_hash(encoded):
+    """(hasher, salt, digest) for a stored hash, or None if it isn't a known format"""
+    try:
+        scheme, params, salt, digest = encoded.split("$")
+        return PASSWORD_HASHERS[scheme].from_params(params), _b64decode(salt), _b64decode(digest)
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+class VerificationCache:
+    """LRU of recently verified (stored hash, password) pairs, keyed by an HMAC
+
+    Keys are HMACs under a per-process random key, so the cache never holds
+    passwords or anything that helps guess them offline. Entries expire after
+    `ttl` seconds and are tied to the stored hash, so a password change
+    invalidates them.
+    """
+
+    def __init__(self, size=VERIFICATION_CACHE_SIZE, ttl=VERIFICATION_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._key = secrets.token_bytes(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, password, encoded):
+        return hmac.new(self._key, f"{encoded}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def contains(self, password, encoded):
+        key = self._cache_key(password, encoded)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, password, encoded):
+        key = self._cache_key(password, encoded)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_verification_cache = VerificationCache()
+
+def hash_password(password):
+    """Salted hash of a password with the default scheme"""
+    return get_default_hasher().hash(password)
+
+def verify_password(password, encoded):
+    """Check a password against a stored hash of any supported format"""
+    if not encoded:
+        return False
+    if _verification_cache.contains(password, encoded):
+        return True
+
+    if is_legacy_hash(encoded):
+        candidate = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        valid = hmac.compare_digest(candidate, encoded)
+    else:
+        parsed = _parse_hash(encoded)
+        if parsed is None:
+            return False
+        hasher, salt, digest = parsed
+        try:
+            valid = hmac.compare_digest(hasher.derive(password, salt), digest)
+        except (ValueError, OverflowError):
+            # Parameters the KDF rejects (e.g. a tampered cost) can't match anything
+            return False
+
+    if valid:
+        _verification_cache.add(password, encoded)
+    return valid
+
+def needs_rehash(encoded):
+    """Whether a stored hash should be replaced with one from the default hasher"""
+    if is_legacy_hash(encoded):
+        return True
+    parsed = _parse_hash(encoded)
+    return parsed is None or not get_default_hasher().is_current(parsed[0])
+
+def time_hasher(hasher, repeats=3):
+    """Best-of-`repeats` milliseconds for one derivation"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        hasher.derive("benchmark password", salt)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+def tune_hasher(scheme, budget_ms=LOGIN_LATENCY_BUDGET_MS):
+    """Strongest parameters for a scheme whose derivation fits in half the latency budget
+
+    Half the budget leaves room for the database lookup, the session setup
+    and load spikes. Returns (hasher, milliseconds).
+    """
+    target_ms = budget_ms / 2
+    if scheme == ScryptHasher.scheme:
+        # Double N (cost and memory) while it fits
+        candidate = ScryptHasher(n=2 ** 12, r=SCRYPT_R, p=SCRYPT_P)
+        best = (candidate, time_hasher(candidate))
+        while True:
+            candidate = ScryptHasher(n=candidate.n * 2, r=SCRYPT_R, p=SCRYPT_P)
+            elapsed = time_hasher(candidate)
+            if elapsed > target_ms or candidate.n > 2 ** 20:
+                return best
+            best = (candidate, elapsed)
+
+    if scheme == PBKDF2Hasher.scheme:
+        # PBKDF2 cost is linear in iterations: scale from a probe
+        probe = PBKDF2Hasher(iterations=100000)
+        per_iteration = time_hasher(probe) / probe.iterations
+        iterations = max(100000, int(target_ms / per_iteration) // 10000 * 10000)
+        hasher = PBKDF2Hasher(iterations=iterations)
+        return hasher, time_hasher(hasher)
+
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+if __name__ == "__main__":
+    print(f"Login latency budget: {LOGIN_LATENCY_BUDGET_MS:.0f} ms")
+    current = get_default_hasher()
+    print(f"Current: {current.scheme} {current.params()} takes {time_hasher(current):.1f} ms")
+    for scheme in PASSWORD_HASHERS:
+        hasher, elapsed = tune_hasher(scheme)
+        print(f"Recommended {scheme}: {hasher.params()} ({elapsed:.1f} ms)")
+        if scheme == ScryptHasher.scheme:
+            print(f"  AGRICARE_SCRYPT_N={hasher.n}")
+        else:
+            print(f"  AGRICARE_PBKDF2_ITERATIONS={hasher.iterations}")
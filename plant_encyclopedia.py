@@ -1,6 +1,13 @@
 import streamlit as st
+import threading
+from types import MappingProxyType
 
-PLANT_ENCYCLOPEDIA = {
+from catalog import catalog_generation, load_catalog
+from search_engine import NgramIndex, normalize_text, tokenize
+
+PLANT_CATALOG_FILE = "plants.jsonl"
+
+BUILTIN_PLANT_ENCYCLOPEDIA = {
     "Tomato": {
         "scientific_name": "Solanum lycopersicum",
         "family": "Solanaceae",
@@ -11,6 +18,8 @@ PLANT_ENCYCLOPEDIA = {
         "temperature": "65-85°F (18-29°C)",
         "humidity": "50-70%",
         "fertilizer": "Balanced fertilizer every 2-3 weeks during growing season",
+        "watering_interval_days": 3,
+        "fertilizing_interval_days": 14,
         "common_diseases": ["Early Blight", "Late Blight", "Bacterial Spot", "Leaf Mold"],
         "companion_plants": ["Basil", "Carrots", "Lettuce", "Peppers"],
         "harvest_time": "70-85 days from transplant",
@@ -31,6 +40,8 @@ PLANT_ENCYCLOPEDIA = {
         "temperature": "Varies by variety, most need chill hours",
         "humidity": "Moderate, good air circulation important",
         "fertilizer": "Annual application of compost and balanced fertilizer",
+        "watering_interval_days": 7,
+        "fertilizing_interval_days": 365,
         "common_diseases": ["Apple Scab", "Fire Blight", "Cedar Apple Rust", "Black Rot"],
         "companion_plants": ["Chives", "Nasturtiums", "Marigolds"],
         "harvest_time": "Late summer to fall, depending on variety",
@@ -51,6 +62,8 @@ PLANT_ENCYCLOPEDIA = {
         "temperature": "60-70°F (15-21°C) optimal",
         "humidity": "Moderate, avoid high humidity",
         "fertilizer": "Low nitrogen, higher phosphorus and potassium",
+        "watering_interval_days": 3,
+        "fertilizing_interval_days": 30,
         "common_diseases": ["Early Blight", "Late Blight", "Potato Scab", "Black Leg"],
         "companion_plants": ["Beans", "Corn", "Cabbage", "Marigolds"],
         "harvest_time": "70-120 days depending on variety",
@@ -71,6 +84,8 @@ PLANT_ENCYCLOPEDIA = {
         "temperature": "70-85°F (21-29°C)",
         "humidity": "50-60%",
         "fertilizer": "Balanced fertilizer, reduce nitrogen once flowering begins",
+        "watering_interval_days": 3,
+        "fertilizing_interval_days": 21,
         "common_diseases": ["Bacterial Spot", "Anthracnose", "Phytophthora Blight"],
         "companion_plants": ["Tomatoes", "Basil", "Onions", "Carrots"],
         "harvest_time": "60-90 days from transplant",
@@ -83,18 +98,114 @@ PLANT_ENCYCLOPEDIA = {
     }
 }
 
-def search_plant_info(query):
-    """Search for plant information"""
-    results = []
-    query_lower = query.lower()
+class PlantEncyclopediaIndex:
+    """Immutable query indexes prebuilt over an encyclopedia mapping
+    
+    Holds an n-gram index over plant name, scientific name and family, a care
+    difficulty facet, and a reverse map from disease to susceptible plants.
+    Query results come back in encyclopedia order.
+    """
+    
+    def __init__(self, encyclopedia):
+        self._order = MappingProxyType({name: position for position, name in enumerate(encyclopedia)})
+        self.name_index = NgramIndex({
+            name: [name, info["scientific_name"], info["family"]]
+            for name, info in encyclopedia.items()
+        })
+        
+        difficulty = {}
+        family = {}
+        disease_plants = {}
+        for name, info in encyclopedia.items():
+            difficulty.setdefault(normalize_text(info["care_difficulty"]), set()).add(name)
+            family.setdefault(normalize_text(info["family"]), set()).add(name)
+            for disease in info["common_diseases"]:
+                disease_plants.setdefault(disease, set()).add(name)
+        
+        self.difficulty_facet = MappingProxyType({k: frozenset(v) for k, v in difficulty.items()})
+        self.family_facet = MappingProxyType({k: frozenset(v) for k, v in family.items()})
+        self.disease_plants = MappingProxyType({k: frozenset(v) for k, v in disease_plants.items()})
+        self.disease_index = NgramIndex({disease: disease for disease in disease_plants})
+        self._normalized_names = MappingProxyType({normalize_text(name): name for name in encyclopedia})
     
-    for plant_name, info in PLANT_ENCYCLOPEDIA.items():
-        if (query_lower in plant_name.lower() or 
-            query_lower in info["scientific_name"].lower() or
-            query_lower in info["family"].lower()):
-            results.append((plant_name, info))
+    def ordered(self, names):
+        """Sort a set of plant names into encyclopedia order"""
+        return sorted(names, key=self._order.__getitem__)
     
-    return results
+    def search(self, query):
+        """Plants whose name, scientific name or family contains query"""
+        return self.name_index.lookup(query)
+    
+    def by_difficulty(self, difficulty):
+        """Plants with the given care difficulty"""
+        return self.difficulty_facet.get(normalize_text(difficulty), frozenset())
+    
+    def by_family(self, family):
+        """Plants in the given botanical family"""
+        return self.family_facet.get(normalize_text(family), frozenset())
+    
+    def susceptible_to(self, disease):
+        """Plants with a common disease whose name contains disease"""
+        plants = set()
+        for disease_name in self.disease_index.lookup(disease):
+            plants |= self.disease_plants[disease_name]
+        return frozenset(plants)
+    
+    def match_species(self, species):
+        """Encyclopedia entry for a free-text species such as 'Cherry Tomatoes', or None"""
+        normalized = normalize_text(species).strip()
+        if normalized in self._normalized_names:
+            return self._normalized_names[normalized]
+        for token in tokenize(species):
+            for candidate in (token, token[:-1], token[:-2]):
+                if candidate in self._normalized_names:
+                    return self._normalized_names[candidate]
+        return None
+    
+    def filter(self, query=None, difficulty=None, disease=None, family=None):
+        """Plants matching every given criterion (AND), in encyclopedia order"""
+        facets = []
+        if difficulty is not None:
+            facets.append(self.by_difficulty(difficulty))
+        if family is not None:
+            facets.append(self.by_family(family))
+        if disease is not None:
+            facets.append(self.susceptible_to(disease))
+        if query is not None:
+            facets.append(self.search(query))
+        
+        if not facets:
+            return list(self._order)
+        
+        # Intersect starting from the most selective facet
+        facets.sort(key=len)
+        result = set(facets[0])
+        for facet in facets[1:]:
+            if not result:
+                break
+            result &= facet
+        return self.ordered(result)
+
+# Loaded from the on-disk catalog when one exists, otherwise the built-in entries
+PLANT_ENCYCLOPEDIA = load_catalog(PLANT_CATALOG_FILE, BUILTIN_PLANT_ENCYCLOPEDIA)
+
+_plant_index = {}
+_plant_index_lock = threading.Lock()
+
+def get_plant_index():
+    """Index over PLANT_ENCYCLOPEDIA, built on first use and after a catalog reload"""
+    generation = catalog_generation(PLANT_ENCYCLOPEDIA)
+    if _plant_index.get('generation') != generation:
+        with _plant_index_lock:
+            if _plant_index.get('generation') != generation:
+                _plant_index['index'] = PlantEncyclopediaIndex(PLANT_ENCYCLOPEDIA)
+                _plant_index['generation'] = generation
+    return _plant_index['index']
+
+def search_plant_info(query):
+    """Search for plant information"""
+    index = get_plant_index()
+    return [(name, PLANT_ENCYCLOPEDIA[name]) for name in index.ordered(index.search(query))]
 
 def get_plant_info(plant_name):
     """Get detailed information about a specific plant"""
@@ -106,18 +217,21 @@ def get_all_plants():
 
 def get_plants_by_difficulty(difficulty):
     """Get plants filtered by care difficulty"""
-    return [name for name, info in PLANT_ENCYCLOPEDIA.items() 
-            if info["care_difficulty"].lower() == difficulty.lower()]
+    index = get_plant_index()
+    return index.ordered(index.by_difficulty(difficulty))
 
 def get_disease_prone_plants(disease):
     """Get plants that are prone to a specific disease"""
-    disease_lower = disease.lower()
-    plants = []
-    
-    for plant_name, info in PLANT_ENCYCLOPEDIA.items():
-        for plant_disease in info["common_diseases"]:
-            if disease_lower in plant_disease.lower():
-                plants.append(plant_name)
-                break
-    
-    return plants
\ No newline at end of file
+    index = get_plant_index()
+    return index.ordered(index.susceptible_to(disease))
+
+def filter_plants(query=None, difficulty=None, disease=None, family=None):
+    """Get plants matching all given filters, e.g. difficulty='Easy' and disease='blight'"""
+    return get_plant_index().filter(query=query, difficulty=difficulty, disease=disease, family=family)
+
+def get_care_interval(species, interval_key, default):
+    """Care interval in days (e.g. 'watering_interval_days') for a tracked plant's species"""
+    plant_name = get_plant_index().match_species(species or "")
+    if plant_name is None:
+        return default
+    return PLANT_ENCYCLOPEDIA[plant_name].get(interval_key, default)
@@ -0,0 +1,227 @@
+"""
+Streaming export and import of plant tracker data as JSON Lines or CSV, optionally gzip-compressed
+
+Exports are produced by generators that yield encoded chunks, and imports read
+the input incrementally, so memory use does not grow with the size of the
+history beyond the records themselves.
+"""
+import csv
+import gzip
+import io
+import json
+import tempfile
+import zlib
+from datetime import datetime
+
+EXPORT_FORMATS = {
+    "jsonl": {"label": "JSON Lines", "extension": "jsonl", "mime": "application/x-ndjson"},
+    "csv": {"label": "CSV", "extension": "csv", "mime": "text/csv"}
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Exports larger than this are spooled to a temporary file on disk
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+MAX_REPORTED_ERRORS = 20
+
+PLANT_FIELDS = [
+    "id", "name", "species", "location", "health_status", "notes",
+    "date_added", "last_watered", "last_fertilized", "last_checked"
+]
+LOG_FIELDS = ["plant_id", "activity", "date", "notes", "disease", "confidence", "plant_name"]
+
+# CSV has one header for both record types; record_type says which fields apply
+CSV_COLUMNS = ["record_type"] + PLANT_FIELDS + [field for field in LOG_FIELDS if field not in PLANT_FIELDS]
+
+PLANT_DATE_FIELDS = ["date_added", "last_watered", "last_fertilized", "last_checked"]
+
+def iter_export_records(plants, logs):
+    """Plants then logs as flat records tagged with a record_type"""
+    for plant in plants:
+        yield {"record_type": "plant", **plant}
+    for log in logs:
+        yield {"record_type": "log", **log}
+
+def _chunked(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_jsonl(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode records as JSON Lines, yielding one bytes chunk per chunk_size records"""
+    for chunk in _chunked(records, chunk_size):
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk).encode("utf-8")
+
+def iter_csv(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode records as CSV, yielding the header and then one bytes chunk per chunk_size records"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+
+    for chunk in _chunked(records, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress a stream of bytes chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def iter_export(plants, logs, fmt="jsonl", compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encoded export of plants and logs in the given format, as a stream of bytes chunks"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    records = iter_export_records(plants, logs)
+    chunks = iter_jsonl(records, chunk_size) if fmt == "jsonl" else iter_csv(records, chunk_size)
+    return iter_gzip(chunks) if compress else chunks
+
+def write_export_file(plants, logs, fmt="jsonl", compress=False, spool_size=EXPORT_SPOOL_SIZE):
+    """Write a streamed export to a temporary file (on disk once it outgrows spool_size) and rewind it"""
+    export_file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    for chunk in iter_export(plants, logs, fmt=fmt, compress=compress):
+        export_file.write(chunk)
+    export_file.seek(0)
+    return export_file
+
+def export_filename(fmt, compress=False, prefix="plant_data"):
+    """Download filename for an export"""
+    filename = f"{prefix}_{datetime.now().strftime('%Y%m%d')}.{EXPORT_FORMATS[fmt]['extension']}"
+    return filename + ".gz" if compress else filename
+
+def _open_text(fileobj):
+    """Text stream over a binary upload, transparently decompressing gzip"""
+    if isinstance(fileobj, (bytes, bytearray)):
+        fileobj = io.BytesIO(fileobj)
+    fileobj = io.BufferedReader(fileobj) if not hasattr(fileobj, "peek") else fileobj
+    if fileobj.peek(2)[:2] == b"\x1f\x8b":
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+
+def iter_jsonl_records(text):
+    """Decoded JSON Lines; a line that isn't valid JSON yields its ValueError instead of stopping the read"""
+    for line in text:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"invalid JSON: {e}")
+
+def iter_csv_records(text):
+    for row in csv.DictReader(text):
+        # Empty CSV cells stand for missing values
+        yield {key: (value if value != "" else None) for key, value in row.items() if key}
+
+def _to_int(value, field):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer, got {value!r}")
+
+def _check_date(value, field):
+    """Parse an ISO date or datetime; None passes through"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{field} is not a valid date: {value!r}")
+
+def _plant_date(value, field):
+    """An imported plant date in the tracker's %Y-%m-%d format (any time of day is dropped)"""
+    moment = _check_date(value, field)
+    return moment.strftime("%Y-%m-%d") if moment is not None else None
+
+def validate_record(record):
+    """Check and normalize one imported record; returns (record_type, record) or raises ValueError"""
+    record = dict(record)
+    record_type = record.pop("record_type", None)
+
+    if record_type == "plant":
+        record = {field: record.get(field) for field in PLANT_FIELDS}
+        if not record["name"] or not record["species"]:
+            raise ValueError("plant records need a name and species")
+        record["id"] = _to_int(record["id"], "id")
+        record["notes"] = record["notes"] or ""
+        for field in PLANT_DATE_FIELDS:
+            record[field] = _plant_date(record[field], field)
+        return "plant", record
+
+    if record_type == "log":
+        record = {key: value for key, value in record.items() if key in LOG_FIELDS and value is not None}
+        if not record.get("activity"):
+            raise ValueError("log records need an activity")
+        record["plant_id"] = _to_int(record.get("plant_id"), "plant_id")
+        record.setdefault("notes", "")
+        _check_date(record.get("date"), "date")
+        if record.get("confidence") is not None:
+            record["confidence"] = float(record["confidence"])
+        return "log", record
+
+    raise ValueError(f"unknown record_type {record_type!r}")
+
+def iter_import_records(fileobj, fmt="jsonl"):
+    """(position, record_type, record) for each record of an export, read one record at a time
+
+    A record that can't be decoded or validated comes out as
+    (position, None, error message) and the read carries on. Raises
+    ValueError if the stream itself can't be read (e.g. truncated gzip).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    text = _open_text(fileobj)
+    records = iter_jsonl_records(text) if fmt == "jsonl" else iter_csv_records(text)
+
+    position = 0
+    try:
+        for record in records:
+            position += 1
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                record_type, record = validate_record(record)
+            except (ValueError, TypeError) as e:
+                yield position, None, str(e)
+                continue
+            yield position, record_type, record
+    except (ValueError, OSError, EOFError, csv.Error) as e:
+        # Undecodable text or a truncated gzip stream stops the import
+        raise ValueError(f"Failed to read import at record {position + 1}: {str(e)}")
+
+def import_records(fileobj, fmt="jsonl"):
+    """Read and validate an export incrementally
+
+    Returns (plants, logs, errors). Invalid or malformed records are skipped
+    and reported with their line/row number; only the first
+    MAX_REPORTED_ERRORS are kept.
+    """
+    plants, logs, errors = [], [], []
+    error_count = 0
+    for position, record_type, record in iter_import_records(fileobj, fmt):
+        if record_type is None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"Record {position}: {record}")
+            continue
+        (plants if record_type == "plant" else logs).append(record)
+
+    if error_count > len(errors):
+        errors.append(f"... and {error_count - len(errors)} more invalid records")
+    return plants, logs, errors
@@ -1,19 +1,64 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import json
+from bisect import bisect_left, insort
+from itertools import chain
+from plant_encyclopedia import get_care_interval
+from plant_io import import_records, iter_export, write_export_file
+from log_archive import iter_archived_logs
 
 def init_plant_tracker():
     """Initialize plant tracker in session state"""
     if 'plants' not in st.session_state:
-        st.session_state.plants = []
+        # Plants are keyed by id (in insertion order) for O(1) lookups
+        st.session_state.plants = {}
+        st.session_state.next_plant_id = 1
     if 'plant_logs' not in st.session_state:
         st.session_state.plant_logs = []
 
+def _next_free_id(plants, logs):
+    """One past every id used by a plant or a log entry"""
+    used_ids = [plant.get("id") for plant in plants] + [log.get("plant_id") for log in logs]
+    return max([i for i in used_ids if isinstance(i, int)], default=0) + 1
+
+def index_plants(plants, logs=()):
+    """Key a list of plant records by id and work out the next free id
+    
+    Records without an id, or whose id was already taken (a collision left by
+    the old length-based ids), get a fresh id. The next id is past every id
+    seen on a plant or a log entry, so logged history never attaches to a new plant.
+    """
+    next_id = _next_free_id(plants, logs)
+    
+    keyed = {}
+    for plant in plants:
+        if plant.get("id") is None or plant["id"] in keyed:
+            plant["id"] = next_id
+            next_id += 1
+        keyed[plant["id"]] = plant
+    return keyed, next_id
+
+def set_tracked_plants(plants, logs):
+    """Replace the session's plants and logs, e.g. after loading or importing"""
+    st.session_state.plants, st.session_state.next_plant_id = index_plants(plants, logs)
+    st.session_state.plant_logs = logs
+
+def get_plant_list():
+    """Tracked plants as a list, in the order they were added"""
+    return list(st.session_state.plants.values())
+
+def allocate_plant_id():
+    """Hand out the next plant id; ids only ever increase"""
+    plant_id = st.session_state.next_plant_id
+    st.session_state.next_plant_id = plant_id + 1
+    return plant_id
+
 def add_plant(name, species, location, health_status, notes=""):
     """Add a new plant to tracker"""
     plant = {
-        "id": len(st.session_state.plants) + 1,
+        "id": allocate_plant_id(),
         "name": name,
         "species": species,
         "location": location,
@@ -24,7 +69,19 @@ def add_plant(name, species, location, health_status, notes=""):
         "last_fertilized": None,
         "last_checked": datetime.now().strftime("%Y-%m-%d")
     }
-    st.session_state.plants.append(plant)
+    st.session_state.plants[plant["id"]] = plant
+    get_care_index().update_plant(plant)
+    return plant
+
+def get_tracked_plant(plant_id):
+    """Look up a tracked plant by id"""
+    return st.session_state.plants.get(plant_id)
+
+def remove_plant(plant_id):
+    """Stop tracking a plant; its id is not handed out again this session"""
+    plant = st.session_state.plants.pop(plant_id, None)
+    if plant is not None:
+        get_care_index().remove_plant(plant_id)
     return plant
 
 def log_plant_activity(plant_id, activity_type, notes=""):
@@ -38,48 +95,232 @@ def log_plant_activity(plant_id, activity_type, notes=""):
     st.session_state.plant_logs.append(log_entry)
     
     # Update plant's last activity dates
-    for plant in st.session_state.plants:
-        if plant["id"] == plant_id:
-            if activity_type == "watering":
-                plant["last_watered"] = datetime.now().strftime("%Y-%m-%d")
-            elif activity_type == "fertilizing":
-                plant["last_fertilized"] = datetime.now().strftime("%Y-%m-%d")
-            plant["last_checked"] = datetime.now().strftime("%Y-%m-%d")
-            break
-
-def get_plant_care_schedule():
-    """Generate care schedule based on tracked plants"""
-    schedule = []
-    
-    for plant in st.session_state.plants:
-        # Check if watering is due (example: every 3 days)
-        if plant["last_watered"]:
-            last_watered = datetime.strptime(plant["last_watered"], "%Y-%m-%d")
-            if datetime.now() - last_watered > timedelta(days=3):
-                schedule.append({
-                    "plant": plant["name"],
-                    "task": "Watering Due",
-                    "priority": "high",
-                    "overdue_days": (datetime.now() - last_watered).days - 3
-                })
+    plant = st.session_state.plants.get(plant_id)
+    if plant is not None:
+        if activity_type == "watering":
+            plant["last_watered"] = datetime.now().strftime("%Y-%m-%d")
+        elif activity_type == "fertilizing":
+            plant["last_fertilized"] = datetime.now().strftime("%Y-%m-%d")
+        plant["last_checked"] = datetime.now().strftime("%Y-%m-%d")
+        get_care_index().update_plant(plant)
+    return log_entry
+
+def merge_tracked_plants(plants, logs):
+    """Bring the session up to date with stored plants and logs, in place
+    
+    Only plants that differ from the session's copy are replaced and
+    re-indexed, so the care index is kept rather than rebuilt.
+    """
+    tracked = st.session_state.plants
+    index = get_care_index()
+    stored_ids = set()
+    for plant in plants:
+        stored_ids.add(plant.get("id"))
+        if tracked.get(plant.get("id")) != plant:
+            tracked[plant["id"]] = plant
+            index.update_plant(plant)
+    for plant_id in [plant_id for plant_id in tracked if plant_id not in stored_ids]:
+        del tracked[plant_id]
+        index.remove_plant(plant_id)
+    
+    st.session_state.plant_logs = logs
+    st.session_state.next_plant_id = max(st.session_state.next_plant_id, _next_free_id(plants, logs))
+
+def persist_plant(username, plant, log_entry=None, new=False):
+    """Save one plant (and a log entry for it) to the user's stored data
+    
+    The plant is merged by id into the stored plants under the file lock, so
+    records other sessions saved meanwhile are kept. A new plant whose id was
+    taken by another session gets the next free id. The session then picks
+    up the merged data in place.
+    """
+    from auth_utils import update_user_plants
+    
+    session_id = plant["id"]
+    
+    def merge(plants, logs):
+        if new and any(stored.get("id") == plant["id"] for stored in plants):
+            plant["id"] = _next_free_id(plants, logs)
+        merged = [plant if stored.get("id") == plant["id"] else stored for stored in plants]
+        if not any(stored.get("id") == plant["id"] for stored in plants):
+            merged.append(plant)
+        return merged, (logs + [log_entry] if log_entry is not None else logs)
+    
+    plants, logs = update_user_plants(username, merge)
+    if plant["id"] != session_id:
+        # Re-keyed: the old id belongs to the other session's plant now
+        st.session_state.plants.pop(session_id, None)
+        get_care_index().remove_plant(session_id)
+    merge_tracked_plants(plants, logs)
+
+def persist_all_plants(username):
+    """Replace the user's stored plants and logs with the session's, e.g. after an import"""
+    from auth_utils import update_user_plants
+    
+    plants, logs = get_plant_list(), st.session_state.plant_logs
+    update_user_plants(username, lambda stored_plants, stored_logs: (plants, logs))
+
+# Recurring care tasks: the plant column holding the last completion date,
+# the encyclopedia key with the species interval, and the fallback interval
+CARE_TASKS = [
+    {
+        "task": "Watering Due",
+        "priority": "high",
+        "column": "last_watered",
+        "interval_key": "watering_interval_days",
+        "default_interval": 3
+    },
+    {
+        "task": "Fertilizing Due",
+        "priority": "medium",
+        "column": "last_fertilized",
+        "interval_key": "fertilizing_interval_days",
+        "default_interval": 30
+    }
+]
+
+PLANT_FRAME_COLUMNS = ["id", "name", "species", "last_watered", "last_fertilized"]
+
+def build_plant_frame(plants):
+    """Columnar view of tracked plants with care dates parsed to datetime64"""
+    frame = pd.DataFrame.from_records(plants, columns=PLANT_FRAME_COLUMNS)
+    for task in CARE_TASKS:
+        frame[task["column"]] = pd.to_datetime(frame[task["column"]], format="%Y-%m-%d", errors="coerce")
+    return frame
+
+def _species_intervals(species, task):
+    """Per-plant interval (days) for a task, resolving each distinct species once"""
+    codes, uniques = pd.factorize(species.fillna(""))
+    intervals = np.array(
+        [get_care_interval(name, task["interval_key"], task["default_interval"]) for name in uniques],
+        dtype=np.int64
+    )
+    return intervals[codes]
+
+class CareScheduleIndex:
+    """Next-due index over (plant, task) pairs, kept sorted by due date
+    
+    Entries are (next_due, plant_order, task_position, plant_id) tuples in a
+    sorted list, so overdue and upcoming tasks are bisect range queries rather
+    than a scan over every plant. Logging an activity only re-indexes that plant.
+    """
+    
+    def __init__(self, plants):
+        # The id-keyed plants mapping this index was built from
+        self.plants = plants
+        self._entries = []
+        self._plant_entries = {}  # plant_id -> entries currently indexed
+        self._plant_order = {}    # plant_id -> order the plant was first seen
+        self._names = {}
         
-        # Check if fertilizing is due (example: every 30 days)
-        if plant["last_fertilized"]:
-            last_fertilized = datetime.strptime(plant["last_fertilized"], "%Y-%m-%d")
-            if datetime.now() - last_fertilized > timedelta(days=30):
-                schedule.append({
-                    "plant": plant["name"],
-                    "task": "Fertilizing Due",
-                    "priority": "medium",
-                    "overdue_days": (datetime.now() - last_fertilized).days - 30
-                })
-    
-    return sorted(schedule, key=lambda x: x["overdue_days"], reverse=True)
+        if not plants:
+            return
+        
+        # Bulk build reuses the columnar computation of due dates
+        frame = build_plant_frame(list(plants.values()))
+        ids = frame["id"].tolist()
+        for plant_id, name in zip(ids, frame["name"].tolist()):
+            self._plant_order.setdefault(plant_id, len(self._plant_order))
+            self._names[plant_id] = name
+        
+        for task_position, task in enumerate(CARE_TASKS):
+            last_done = frame[task["column"]].to_numpy(dtype="datetime64[ns]")
+            intervals = _species_intervals(frame["species"], task)
+            next_due = (last_done + intervals * np.timedelta64(1, "D")).astype("datetime64[us]").tolist()
+            for position in np.flatnonzero(~np.isnat(last_done)):
+                plant_id = ids[position]
+                entry = (next_due[position], self._plant_order[plant_id], task_position, plant_id)
+                self._entries.append(entry)
+                self._plant_entries.setdefault(plant_id, []).append(entry)
+        self._entries.sort()
+    
+    def _plant_tasks(self, plant):
+        """(next_due, task_position) for each task the plant has a completion date for"""
+        tasks = []
+        for task_position, task in enumerate(CARE_TASKS):
+            try:
+                last_done = datetime.strptime(plant[task["column"]], "%Y-%m-%d")
+            except (KeyError, TypeError, ValueError):
+                # Missing or unparseable dates are left unscheduled, as in build_plant_frame
+                continue
+            interval = get_care_interval(plant.get("species"), task["interval_key"], task["default_interval"])
+            tasks.append((last_done + timedelta(days=interval), task_position))
+        return tasks
+    
+    def update_plant(self, plant):
+        """Re-index one plant after it was added or its care dates changed"""
+        plant_id = plant["id"]
+        self.remove_plant(plant_id)
+        self._plant_order.setdefault(plant_id, len(self._plant_order))
+        self._names[plant_id] = plant["name"]
+        
+        entries = []
+        for next_due, task_position in self._plant_tasks(plant):
+            entry = (next_due, self._plant_order[plant_id], task_position, plant_id)
+            insort(self._entries, entry)
+            entries.append(entry)
+        self._plant_entries[plant_id] = entries
+    
+    def remove_plant(self, plant_id):
+        """Drop a plant's entries from the index"""
+        for entry in self._plant_entries.pop(plant_id, []):
+            position = bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+    
+    def _task(self, entry, now):
+        next_due, _, task_position, plant_id = entry
+        task = CARE_TASKS[task_position]
+        return {
+            "plant": self._names[plant_id],
+            "plant_id": plant_id,
+            "task": task["task"],
+            "priority": task["priority"],
+            "due_date": next_due.strftime("%Y-%m-%d"),
+            "overdue_days": (now - next_due).days
+        }
+    
+    def due(self, now=None, top_n=None):
+        """Tasks past their due date, most overdue first"""
+        now = now or datetime.now()
+        end = bisect_left(self._entries, (now,))
+        if top_n is not None:
+            end = min(end, top_n)
+        return [self._task(entry, now) for entry in self._entries[:end]]
+    
+    def upcoming(self, days, now=None):
+        """Tasks falling due within the next `days` days, soonest first"""
+        now = now or datetime.now()
+        start = bisect_left(self._entries, (now,))
+        end = bisect_left(self._entries, (now + timedelta(days=days),))
+        tasks = [self._task(entry, now) for entry in self._entries[start:end]]
+        for task in tasks:
+            task["due_in_days"] = -task.pop("overdue_days")
+        return tasks
+    
+    def __len__(self):
+        return len(self._entries)
+
+def get_care_index():
+    """Session care index, rebuilt only when the plant list itself is replaced"""
+    index = st.session_state.get("care_index")
+    if index is None or index.plants is not st.session_state.plants:
+        index = CareScheduleIndex(st.session_state.plants)
+        st.session_state.care_index = index
+    return index
+
+def get_plant_care_schedule(top_n=None):
+    """Generate care schedule based on tracked plants"""
+    return get_care_index().due(top_n=top_n)
+
+def get_upcoming_care_tasks(days=7):
+    """Care tasks due within the next few days, for reminder batching"""
+    return get_care_index().upcoming(days)
 
 def export_plant_data():
     """Export plant data as JSON"""
     data = {
-        "plants": st.session_state.plants,
+        "plants": get_plant_list(),
         "logs": st.session_state.plant_logs,
         "export_date": datetime.now().isoformat()
     }
@@ -89,8 +330,37 @@ def import_plant_data(json_data):
     """Import plant data from JSON"""
     try:
         data = json.loads(json_data)
-        st.session_state.plants = data.get("plants", [])
-        st.session_state.plant_logs = data.get("logs", [])
+        set_tracked_plants(data.get("plants", []), data.get("logs", []))
         return True
     except:
-        return False
\ No newline at end of file
+        return False
+
+def export_plant_data_stream(fmt="jsonl", compress=False):
+    """Stream the tracked plants and logs as JSON Lines or CSV bytes chunks"""
+    return iter_export(get_plant_list(), st.session_state.plant_logs, fmt=fmt, compress=compress)
+
+def plant_export_bytes(fmt="jsonl", compress=False):
+    """The full export (archived history included) as bytes, for a download button"""
+    plants, logs = get_plant_list(), st.session_state.plant_logs
+    username = st.session_state.get("username") if st.session_state.get("authenticated") else None
+    # Full history: archived segments stream ahead of the hot logs
+    history = chain(iter_archived_logs(username), logs) if username else logs
+    with write_export_file(plants, history, fmt=fmt, compress=compress) as export_file:
+        return export_file.read()
+
+def import_plant_data_stream(fileobj, fmt="jsonl"):
+    """Import a JSON Lines or CSV export (optionally gzipped) chunk by chunk
+    
+    Returns (success, errors). Invalid records are skipped and reported; the
+    session data is only replaced if at least one record was valid.
+    """
+    try:
+        plants, logs, errors = import_records(fileobj, fmt)
+    except ValueError as e:
+        return False, [str(e)]
+    
+    if not plants and not logs:
+        return False, errors or ["No records found"]
+    
+    set_tracked_plants(plants, logs)
+    return True, errors
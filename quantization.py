@@ -0,0 +1,216 @@
+"""
+Post-training quantization of the disease model, with an accuracy/latency report
+
+Quantized variants are written next to the float32 model file, where
+AGRICARE_MODEL_VARIANT picks them up (see inference_backends):
+
+    float16   weights stored as float16 (half the size, float compute)
+    int8      weights and activations in int8, calibrated on sample images
+
+int8 calibration runs the float32 model over a directory of representative
+leaf photos to find activation ranges, so the directory should cover the
+plants and diseases in CLASS_NAMES.
+
+    python quantization.py quantize --backend tflite --images calibration/
+    python quantization.py report --backend tflite --images samples/
+
+The report compares each variant with float32 on the same images: top-1
+agreement over CLASS_NAMES, per-image latency and memory (model file size and
+resident memory added by loading it).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from inference_backends import (
+    INFERENCE_BACKENDS, MODEL_VARIANTS, ONNX_MODEL_PATH, SAVEDMODEL_PATH, TFLITE_MODEL_PATH, variant_path
+)
+from model_utils import preprocess_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Images used for int8 calibration; more rarely changes the ranges
+CALIBRATION_LIMIT = 200
+REPORT_BATCH_SIZE = 16
+
+def image_paths(directory, limit=None):
+    """Image files under a directory (recursively), in a stable order"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+def iter_image_batches(paths, input_size=(224, 224), batch_size=REPORT_BATCH_SIZE):
+    """Preprocessed float32 NHWC batches of image files"""
+    from PIL import Image
+
+    for start in range(0, len(paths), batch_size):
+        batch = []
+        for path in paths[start:start + batch_size]:
+            with Image.open(path) as image:
+                batch.append(preprocess_image(image, input_size))
+        yield np.concatenate(batch)
+
+def _calibration_images(directory):
+    paths = image_paths(directory, CALIBRATION_LIMIT)
+    if not paths:
+        raise ValueError(f"No calibration images found in {directory}")
+    return paths
+
+def quantize_tflite(variant, calibration_dir=None, savedmodel_path=SAVEDMODEL_PATH):
+    """Convert the SavedModel to a quantized TFLite model; returns its path"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(savedmodel_path)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        paths = _calibration_images(calibration_dir)
+        _, height, width, _ = tf.keras.models.load_model(savedmodel_path, compile=False).input_shape
+
+        def representative_dataset():
+            for batch in iter_image_batches(paths, (width or 224, height or 224), batch_size=1):
+                yield [batch]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # uint8 input takes the pixels without a float conversion; TFLiteBackend reads the scales
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    else:
+        raise ValueError(f"Unknown quantized variant '{variant}'")
+
+    path = variant_path(TFLITE_MODEL_PATH, variant)
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+def quantize_onnx(variant, calibration_dir=None, model_path=ONNX_MODEL_PATH):
+    """Quantize the float32 ONNX model; returns the quantized model's path"""
+    path = variant_path(model_path, variant)
+    if variant == "float16":
+        import onnx
+        from onnxconverter_common import float16
+
+        # Inputs and outputs stay float32 so the backend's conversion is unchanged
+        model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+        onnx.save(model, path)
+        return path
+
+    if variant != "int8":
+        raise ValueError(f"Unknown quantized variant '{variant}'")
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    paths = _calibration_images(calibration_dir)
+    reference = INFERENCE_BACKENDS["onnx"](path=model_path, variant="float32")
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter_image_batches(paths, reference.input_size, batch_size=1)
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {reference.input_name: reference.prepare(batch)}
+
+    quantize_static(
+        model_path, path, ImageReader(),
+        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8
+    )
+    return path
+
+QUANTIZERS = {
+    "tflite": quantize_tflite,
+    "onnx": quantize_onnx
+}
+
+def _resident_memory():
+    """Resident set size in bytes (0 where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+def _model_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def compare_variants(backend_name, image_dir, variants=MODEL_VARIANTS):
+    """Score the images with each available variant of a backend
+
+    Returns one dict per variant with `top1_agreement` (share of images whose
+    top class matches the first variant compared, normally float32), `mean_ms` / `p95_ms` (single-image latency),
+    `batch_ms_per_image`, `model_mb` and `loaded_mb` (resident memory added
+    by loading).
+    """
+    backend = INFERENCE_BACKENDS[backend_name]
+    paths = image_paths(image_dir)
+    if not paths:
+        raise ValueError(f"No images found in {image_dir}")
+
+    rows = []
+    reference_top1 = None
+    for variant in variants:
+        if variant not in backend.variants or not backend.available(variant):
+            continue
+        before = _resident_memory()
+        model = backend(variant=variant)
+        loaded = _resident_memory() - before
+
+        batches = list(iter_image_batches(paths, model.input_size))
+        start = time.perf_counter()
+        top1 = np.concatenate([model.predict(batch).argmax(axis=1) for batch in batches])
+        batch_ms = (time.perf_counter() - start) * 1000 / len(paths)
+
+        latencies = []
+        for batch in batches:
+            for image in batch:
+                start = time.perf_counter()
+                model.predict(image[None])
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        if reference_top1 is None:
+            reference_top1 = top1
+        rows.append({
+            "variant": variant,
+            "images": len(paths),
+            "top1_agreement": float(np.mean(top1 == reference_top1)),
+            "mean_ms": float(np.mean(latencies)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "batch_ms_per_image": batch_ms,
+            "model_mb": _model_size(model.path) / 2 ** 20 if model.path else 0.0,
+            "loaded_mb": loaded / 2 ** 20
+        })
+    return rows
+
+def print_report(rows):
+    if not rows:
+        print("No model variants available")
+        return
+    print(f"{rows[0]['images']} images, agreement is with the first variant listed")
+    print(f"{'variant':<9} {'top-1 agr.':>10} {'mean ms':>8} {'p95 ms':>8} {'batch ms':>9} {'file MB':>8} {'RSS MB':>8}")
+    for row in rows:
+        print(
+            f"{row['variant']:<9} {row['top1_agreement']:>10.1%} {row['mean_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+            f"{row['batch_ms_per_image']:>9.2f} {row['model_mb']:>8.1f} {row['loaded_mb']:>8.1f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize the disease model and compare the variants")
+    parser.add_argument("command", choices=["quantize", "report"])
+    parser.add_argument("--backend", choices=sorted(QUANTIZERS), default="tflite")
+    parser.add_argument("--images", required=True, help="Directory of sample leaf images")
+    parser.add_argument("--variants", nargs="+", choices=MODEL_VARIANTS, default=list(MODEL_VARIANTS))
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        for variant in args.variants:
+            if variant != "float32":
+                print(f"{variant}: {QUANTIZERS[args.backend](variant, args.images)}")
+    print_report(compare_variants(args.backend, args.images, args.variants))
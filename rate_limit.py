@@ -0,0 +1,224 @@
+"""
+Token-bucket rate limiting for login attempts
+
+Every attempt takes one token from a bucket for the username and one for the
+client (IP address). Buckets refill continuously at a fixed rate up to their
+capacity, so a user can retry a few times in a row but a sustained burst is
+throttled to the refill rate. The check runs before the user lookup and
+password hash, so a rejected attempt costs a dict lookup (or one SQLite
+transaction with the shared store).
+
+Buckets live in process memory by default. Setting AGRICARE_RATE_LIMIT_DB
+to a SQLite file shares them between processes.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+
+RATE_LIMIT_DB = os.environ.get("AGRICARE_RATE_LIMIT_DB")
+
+# (capacity, tokens refilled per second)
+USER_BUCKET = (5, 1 / 30)
+CLIENT_BUCKET = (20, 1 / 6)
+
+# Window over which attempts and rejections are counted for metrics
+METRICS_WINDOW = 300
+
+# Distinct rejected keys tracked for the top-offenders metric
+MAX_TRACKED_KEYS = 10000
+
+# Buckets that have refilled completely carry no state and are dropped after this many seconds idle
+IDLE_BUCKET_TTL = 3600
+
+def _refill(tokens, updated, now, capacity, rate):
+    return min(capacity, tokens + (now - updated) * rate)
+
+class MemoryBucketStore:
+    """Token buckets in a dict, for a single process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def take(self, key, capacity, rate, now=None):
+        """Take a token from a bucket; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / rate
+            if now - self._last_prune > IDLE_BUCKET_TTL:
+                self._prune(now)
+            return allowed, retry_after
+
+    def _prune(self, now):
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < IDLE_BUCKET_TTL
+        }
+        self._last_prune = now
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite table, shared by every process using the same file
+
+    Uses wall-clock time, since monotonic clocks aren't comparable across processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets (updated)")
+        conn.commit()
+        # Idle buckets are pruned on the first take, then at most once per IDLE_BUCKET_TTL
+        self._last_prune = 0.0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, capacity, rate) if row else capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if now - self._last_prune > IDLE_BUCKET_TTL:
+            self._last_prune = now
+            conn.execute("DELETE FROM rate_limit_buckets WHERE updated < ?", (now - IDLE_BUCKET_TTL,))
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def reset(self, key):
+        self._connect().execute("DELETE FROM rate_limit_buckets WHERE key = ?", (key,))
+
+class SlidingWindowCounter:
+    """Event counts over the last `window` seconds, in one-second slots"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._slots = deque()
+        self._lock = threading.Lock()
+
+    def add(self, now=None, count=1):
+        second = int(time.monotonic() if now is None else now)
+        with self._lock:
+            if self._slots and self._slots[-1][0] == second:
+                self._slots[-1][1] += count
+            else:
+                self._slots.append([second, count])
+            self._expire(second)
+
+    def _expire(self, second):
+        while self._slots and self._slots[0][0] <= second - self.window:
+            self._slots.popleft()
+
+    def total(self, now=None):
+        second = int(time.monotonic() if now is None else now)
+        with self._lock:
+            self._expire(second)
+            return sum(count for _, count in self._slots)
+
+class LoginRateLimiter:
+    """Per-username and per-client token buckets for login attempts, with metrics"""
+
+    def __init__(self, store=None, user_bucket=USER_BUCKET, client_bucket=CLIENT_BUCKET):
+        self.store = store or MemoryBucketStore()
+        self.user_bucket = user_bucket
+        self.client_bucket = client_bucket
+        self.allowed_total = 0
+        self.rejected_total = 0
+        self.attempts = SlidingWindowCounter()
+        self.rejections = SlidingWindowCounter()
+        self.rejected_keys = Counter()
+        self._lock = threading.Lock()
+
+    def check(self, username, client=None):
+        """Count a login attempt; returns (allowed, retry_after_seconds)
+
+        The client bucket is checked first, so one client spraying many
+        usernames is stopped without draining those users' buckets.
+        """
+        self.attempts.add()
+        checks = [(f"client:{client}", self.client_bucket)] if client else []
+        checks.append((f"user:{username.lower()}", self.user_bucket))
+
+        for key, (capacity, rate) in checks:
+            allowed, retry_after = self.store.take(key, capacity, rate)
+            if not allowed:
+                self.rejections.add()
+                with self._lock:
+                    self.rejected_total += 1
+                    self.rejected_keys[key] += 1
+                    if len(self.rejected_keys) > MAX_TRACKED_KEYS:
+                        self.rejected_keys = Counter(dict(self.rejected_keys.most_common(MAX_TRACKED_KEYS // 10)))
+                return False, retry_after
+
+        with self._lock:
+            self.allowed_total += 1
+        return True, 0.0
+
+    def reset_user(self, username):
+        """Refill a user's bucket, e.g. after a successful login"""
+        self.store.reset(f"user:{username.lower()}")
+
+    def metrics(self):
+        """Counters for monitoring"""
+        with self._lock:
+            top_rejected = self.rejected_keys.most_common(10)
+            allowed_total, rejected_total = self.allowed_total, self.rejected_total
+        return {
+            "store": type(self.store).__name__,
+            "allowed_total": allowed_total,
+            "rejected_total": rejected_total,
+            f"attempts_last_{METRICS_WINDOW}s": self.attempts.total(),
+            f"rejections_last_{METRICS_WINDOW}s": self.rejections.total(),
+            "top_rejected": top_rejected
+        }
+
+_login_limiter = None
+_login_limiter_lock = threading.Lock()
+
+def get_login_limiter():
+    """Process-wide login rate limiter"""
+    global _login_limiter
+    if _login_limiter is None:
+        with _login_limiter_lock:
+            if _login_limiter is None:
+                store = SQLiteBucketStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketStore()
+                _login_limiter = LoginRateLimiter(store)
+    return _login_limiter
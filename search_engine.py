@@ -0,0 +1,227 @@
+"""
+Lightweight in-memory full-text search with BM25 ranking, prefix and typo-tolerant lookup
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
+from math import log
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with'
+])
+
+# Weights applied to a document when a query term matches it only by prefix or by a typo
+PREFIX_MATCH_WEIGHT = 0.8
+TYPO_MATCH_WEIGHT = 0.6
+
+# Shortest query terms eligible for prefix and typo expansion
+MIN_PREFIX_LENGTH = 2
+MIN_TYPO_LENGTH = 4
+
+def normalize_text(text):
+    """Lowercase text and strip accents so lookups are case and accent insensitive"""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.lower()
+
+def tokenize(text):
+    """Split text into normalized tokens, dropping stop words"""
+    return [token for token in TOKEN_PATTERN.findall(normalize_text(text)) if token not in STOP_WORDS]
+
+def _deletes(term):
+    """All variants of a term with exactly one character removed"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+def _within_one_edit(a, b):
+    """Check whether two terms differ by at most one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > 1:
+        return False
+
+    # Skip the common prefix, then compare what's left
+    i = 0
+    while i < min(len_a, len_b) and a[i] == b[i]:
+        i += 1
+
+    if len_a == len_b:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]
+    if len_a > len_b:
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+class SearchIndex:
+    """Inverted index over a collection of documents, scored with BM25
+
+    Documents are given as a mapping of document id to a dict of field name to
+    text (a string or a list of strings). Field weights scale how much a term
+    occurrence in that field counts towards the document's term frequency.
+    All per-term BM25 contributions are computed once at build time, so a query
+    only sums precomputed postings.
+    """
+
+    def __init__(self, documents, field_weights=None, k1=1.2, b=0.75):
+        self.field_weights = field_weights or {}
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = list(documents.keys())
+
+        term_frequencies = []
+        doc_lengths = []
+        for doc_id in self.doc_ids:
+            counts = Counter()
+            for field, value in documents[doc_id].items():
+                weight = self.field_weights.get(field, 1.0)
+                values = value if isinstance(value, (list, tuple)) else [value]
+                for text in values:
+                    for token in tokenize(text):
+                        counts[token] += weight
+            term_frequencies.append(counts)
+            doc_lengths.append(sum(counts.values()))
+
+        num_docs = len(self.doc_ids)
+        avg_length = (sum(doc_lengths) / num_docs) if num_docs else 0.0
+
+        document_frequency = Counter()
+        for counts in term_frequencies:
+            document_frequency.update(counts.keys())
+
+        # term -> list of (doc position, BM25 contribution)
+        self.postings = defaultdict(list)
+        for position, counts in enumerate(term_frequencies):
+            length_norm = 1 - b + b * (doc_lengths[position] / avg_length if avg_length else 0)
+            for term, tf in counts.items():
+                idf = log(1 + (num_docs - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score = idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+                self.postings[term].append((position, score))
+        self.postings = dict(self.postings)
+
+        # Sorted vocabulary for prefix lookups and a delete-neighbourhood map for typos
+        self.vocabulary = sorted(self.postings)
+        self.typo_map = defaultdict(set)
+        for term in self.vocabulary:
+            if len(term) >= MIN_TYPO_LENGTH - 1:
+                for variant in _deletes(term):
+                    self.typo_map[variant].add(term)
+        self.typo_map = dict(self.typo_map)
+
+        self._expand_term = lru_cache(maxsize=4096)(self._expand_term_uncached)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _prefix_terms(self, prefix):
+        """Vocabulary terms starting with prefix (binary search over the sorted vocabulary)"""
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _typo_terms(self, term):
+        """Vocabulary terms within one edit of term"""
+        candidates = set(self.typo_map.get(term, ()))
+        for variant in _deletes(term) | {term}:
+            if variant in self.postings:
+                candidates.add(variant)
+            candidates.update(self.typo_map.get(variant, ()))
+        return [candidate for candidate in candidates if _within_one_edit(term, candidate)]
+
+    def _expand_term_uncached(self, term, prefix, typos):
+        """Map a query term to the index terms it matches, with a weight per match kind"""
+        expansions = {}
+        if term in self.postings:
+            expansions[term] = 1.0
+
+        if prefix and len(term) >= MIN_PREFIX_LENGTH:
+            for candidate in self._prefix_terms(term):
+                expansions.setdefault(candidate, PREFIX_MATCH_WEIGHT)
+
+        if typos and not expansions and len(term) >= MIN_TYPO_LENGTH:
+            for candidate in self._typo_terms(term):
+                expansions.setdefault(candidate, TYPO_MATCH_WEIGHT)
+
+        return tuple(expansions.items())
+
+    def search(self, query, limit=None, prefix=True, typos=True):
+        """Return (doc_id, score) pairs for documents matching query, best first"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            # A document scores once per query term, through its best matching expansion
+            term_scores = {}
+            for candidate, weight in self._expand_term(term, prefix, typos):
+                for position, score in self.postings[candidate]:
+                    weighted = score * weight
+                    if weighted > term_scores.get(position, 0.0):
+                        term_scores[position] = weighted
+            for position, score in term_scores.items():
+                scores[position] += score
+
+        # Ties keep the original document order
+        ranked = ((-score, position) for position, score in scores.items())
+        if limit is not None:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked = sorted(ranked)
+        return [(self.doc_ids[position], -neg_score) for neg_score, position in ranked]
+
+class NgramIndex:
+    """Substring index over short strings (names, families) using character n-grams
+
+    Every indexed value is broken into its 1- to n-character grams, each mapping
+    to the keys whose value contains it. A substring query intersects the
+    postings of its grams and only verifies the few surviving candidates.
+    """
+
+    def __init__(self, values, n=3):
+        self.n = n
+        self._values = {}
+        postings = defaultdict(set)
+        for key, texts in values.items():
+            texts = texts if isinstance(texts, (list, tuple)) else [texts]
+            normalized = tuple(normalize_text(text) for text in texts)
+            self._values[key] = normalized
+            for text in normalized:
+                for gram in self._grams(text, include_short=True):
+                    postings[gram].add(key)
+        self._postings = {gram: frozenset(keys) for gram, keys in postings.items()}
+
+    def _grams(self, text, include_short=False):
+        """Character n-grams of text; short grams are only needed when indexing"""
+        sizes = range(1, self.n + 1) if include_short else [min(self.n, len(text))]
+        grams = set()
+        for size in sizes:
+            for i in range(len(text) - size + 1):
+                grams.add(text[i:i + size])
+        return grams
+
+    def lookup(self, query):
+        """Keys whose value contains query as a substring"""
+        query = normalize_text(query)
+        if not query:
+            return frozenset(self._values)
+
+        candidates = None
+        for gram in self._grams(query):
+            keys = self._postings.get(gram)
+            if not keys:
+                return frozenset()
+            candidates = keys if candidates is None else candidates & keys
+
+        if len(query) <= self.n:
+            return candidates
+        return frozenset(
+            key for key in candidates
+            if any(query in text for text in self._values[key])
+        )
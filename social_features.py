@@ -1,9 +1,10 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime, timedelta
-from auth_utils import load_users, get_user_data_path
+from auth_utils import load_users, get_user_data_path, update_user_plants
+from storage import read_json
+from instrumentation import timed
 
+@timed()
 def get_community_stats():
     """Get community statistics"""
     users = load_users()
@@ -32,18 +33,17 @@ def get_community_stats():
     
     return stats
 
+@timed()
 def load_user_plants_data(username):
     """Load user plants data (helper function)"""
     filepath = get_user_data_path(username, "plants.json")
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-                return data.get("plants", []), data.get("logs", [])
-        except:
-            return [], []
-    return [], []
+    try:
+        data = read_json(filepath, {})
+    except OSError:
+        return [], []
+    return data.get("plants", []), data.get("logs", [])
 
+@timed()
 def get_farmer_insights():
     """Get insights specifically for farmers"""
     users = load_users()
@@ -81,6 +81,7 @@ def get_farmer_insights():
     
     return insights
 
+@timed()
 def get_disease_alerts():
     """Get disease alerts based on community data"""
     users = load_users()
@@ -140,11 +141,10 @@ def get_success_stories():
     ]
     return stories
 
+@timed()
 def log_disease_detection(username, disease_name, confidence, plant_name):
     """Log disease detection for community tracking"""
     try:
-        plants, logs = load_user_plants_data(username)
-        
         # Add disease detection log
         new_log = {
             "plant_id": None,  # Find plant ID if needed
@@ -156,11 +156,8 @@ def log_disease_detection(username, disease_name, confidence, plant_name):
             "plant_name": plant_name
         }
         
-        logs.append(new_log)
-        
-        # Save updated data
-        from auth_utils import save_user_plants
-        save_user_plants(username, plants, logs)
+        # Append under the file lock so concurrent sessions don't drop each other's logs
+        update_user_plants(username, lambda plants, logs: (plants, logs + [new_log]))
         
     except Exception as e:
         st.error(f"Error logging disease detection: {e}")
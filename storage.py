@@ -0,0 +1,134 @@
+"""
+Crash- and concurrency-safe JSON file storage for users.json and per-user data files
+
+Writes go to a temporary file in the same directory, are fsynced and then
+renamed over the target, so readers only ever see a complete old or new file.
+Each file has an advisory lock (<file>.lock) that serializes writers across
+sessions and processes, and read-modify-write updates hold it for the whole
+cycle.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+def _thread_lock(path):
+    """In-process lock for a path; flock alone doesn't serialize threads sharing a process"""
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        if key not in _path_locks:
+            _path_locks[key] = threading.RLock()
+        return _path_locks[key]
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold the advisory lock for a data file (exclusive unless shared=True)"""
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(path + LOCK_SUFFIX, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _fsync_directory(directory):
+    """Make a rename durable; not supported on every platform"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _encode(data, indent=2):
+    return json.dumps(data, indent=indent).encode('utf-8')
+
+def write_atomic(path, write):
+    """Replace a file with what `write(f)` writes to a fsynced temporary file (no locking)
+
+    The temporary file has a unique name, so concurrent writers of the same
+    path never write into each other's file; the last rename wins.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+def write_bytes_atomic(path, payload):
+    """Replace a file with `payload` via a fsynced temporary file (no locking)"""
+    write_atomic(path, lambda f: f.write(payload))
+
+def write_json_atomic(path, data, indent=2):
+    """Replace a JSON file atomically under its lock"""
+    payload = _encode(data, indent)
+    with file_lock(path):
+        write_bytes_atomic(path, payload)
+
+def _read_unlocked(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError as e:
+        # Keep the unreadable file for inspection instead of overwriting it on the next save
+        quarantined = f"{path}.corrupt-{time.strftime('%Y%m%d%H%M%S')}"
+        os.replace(path, quarantined)
+        print(f"Unreadable data file {path} moved to {quarantined}: {str(e)}")
+        return default
+
+def read_json(path, default=None):
+    """Load a JSON file under a shared lock
+
+    A missing file gives `default`. A corrupt file is moved aside and also
+    gives `default`.
+    """
+    with file_lock(path, shared=True):
+        return _read_unlocked(path, default)
+
+def update_json(path, update, default=None, indent=2):
+    """Read-modify-write a JSON file while holding its lock
+
+    `update` receives the current data (or `default`) and returns the new
+    data.
+    """
+    with file_lock(path):
+        data = update(_read_unlocked(path, default))
+        write_bytes_atomic(path, _encode(data, indent))
+        return data
+
+def save_json(path, data, indent=2):
+    """Save a JSON file atomically; the data is encoded before the lock is taken"""
+    write_json_atomic(path, data, indent)
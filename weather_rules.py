@@ -0,0 +1,179 @@
+"""
+Declarative weather rules evaluated over per-field readings in a single vectorized pass
+"""
+import operator
+import time
+
+import numpy as np
+import pandas as pd
+
+# Each rule fires for every field whose reading of `metric` compares true
+# against `threshold`. Messages are templates rendered only for the rows shown;
+# they may use {value}, {threshold} and {field}.
+WEATHER_RULES = [
+    {
+        "id": "high_temperature",
+        "metric": "temperature", "op": ">", "threshold": 30,
+        "type": "warning", "severity": 3, "icon": "🌡️",
+        "title": "High Temperature Alert",
+        "message": "Increase watering frequency and provide shade for sensitive plants. Monitor for heat stress."
+    },
+    {
+        "id": "cold_temperature",
+        "metric": "temperature", "op": "<", "threshold": 5,
+        "type": "warning", "severity": 3, "icon": "❄️",
+        "title": "Cold Weather Alert",
+        "message": "Protect plants from frost. Move potted plants indoors if possible."
+    },
+    {
+        "id": "high_humidity",
+        "metric": "humidity", "op": ">", "threshold": 80,
+        "type": "info", "severity": 2, "icon": "💧",
+        "title": "High Humidity",
+        "message": "Watch for fungal diseases. Ensure good air circulation around plants."
+    },
+    {
+        "id": "low_humidity",
+        "metric": "humidity", "op": "<", "threshold": 30,
+        "type": "info", "severity": 1, "icon": "🏜️",
+        "title": "Low Humidity",
+        "message": "Consider misting plants or using humidity trays for moisture-loving species."
+    },
+    {
+        "id": "heavy_rainfall",
+        "metric": "rainfall", "op": ">", "threshold": 20,
+        "type": "warning", "severity": 3, "icon": "☔",
+        "title": "Heavy Rainfall",
+        "message": "Check for waterlogged soil and ensure proper drainage. Watch for root rot signs."
+    },
+    {
+        "id": "dry_conditions",
+        "metric": "rainfall", "op": "<", "threshold": 0.5,
+        "type": "info", "severity": 1, "icon": "☀️",
+        "title": "Dry Conditions",
+        "message": "Increase watering frequency. Check soil moisture regularly."
+    }
+]
+
+RULE_OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq
+}
+
+RECOMMENDATION_COLUMNS = ["field", "rule_id", "value", "type", "severity", "icon", "title", "message", "threshold"]
+
+def build_rule_table(rules=WEATHER_RULES):
+    """Turn a list of rule dicts into a DataFrame, validating operators"""
+    table = pd.DataFrame(rules)
+    unknown = set(table["op"]) - set(RULE_OPERATORS)
+    if unknown:
+        raise ValueError(f"Unknown rule operators: {', '.join(sorted(unknown))}")
+    return table.reset_index(drop=True)
+
+RULE_TABLE = build_rule_table()
+
+def evaluate_weather_rules(readings, rule_table=RULE_TABLE):
+    """Evaluate every rule against every field at once
+
+    `readings` is a DataFrame with one row per field (the index identifies the
+    field) and one column per metric. Returns a long DataFrame with one row per
+    (field, fired rule), ordered by field and then rule table order. Missing
+    metrics and NaN readings never fire.
+    """
+    field_positions = []
+    rule_positions = []
+    values = []
+
+    # One vectorized comparison per rule; the loop is over rules, not fields
+    for rule_position, rule in enumerate(rule_table.itertuples(index=False)):
+        if rule.metric not in readings.columns:
+            continue
+        column = readings[rule.metric].to_numpy(dtype=np.float64, na_value=np.nan)
+        hits = np.flatnonzero(RULE_OPERATORS[rule.op](column, rule.threshold))
+        field_positions.append(hits)
+        rule_positions.append(np.full(len(hits), rule_position))
+        values.append(column[hits])
+
+    if not field_positions:
+        return pd.DataFrame(columns=RECOMMENDATION_COLUMNS)
+
+    field_positions = np.concatenate(field_positions)
+    rule_positions = np.concatenate(rule_positions)
+    values = np.concatenate(values)
+
+    # Stable sort by field keeps rule table order within each field
+    order = np.argsort(field_positions, kind="stable")
+    field_positions = field_positions[order]
+    rule_positions = rule_positions[order]
+
+    fired = rule_table.take(rule_positions).reset_index(drop=True)
+    result = pd.DataFrame({
+        "field": readings.index.to_numpy()[field_positions],
+        "rule_id": fired["id"].to_numpy(),
+        "value": values[order],
+        "type": fired["type"].to_numpy(),
+        "severity": fired["severity"].to_numpy(),
+        "icon": fired["icon"].to_numpy(),
+        "title": fired["title"].to_numpy(),
+        "message": fired["message"].to_numpy(),
+        "threshold": fired["threshold"].to_numpy()
+    })
+    return result
+
+def render_recommendations(fired):
+    """Render the message templates of fired rules into recommendation dicts"""
+    recommendations = []
+    for row in fired.itertuples(index=False):
+        recommendations.append({
+            "type": row.type,
+            "icon": row.icon,
+            "title": row.title,
+            "message": row.message.format(value=row.value, threshold=row.threshold, field=row.field),
+            "severity": int(row.severity),
+            "field": row.field
+        })
+    return recommendations
+
+def recommendations_by_field(readings, rule_table=RULE_TABLE, min_severity=None):
+    """Group fired rules per field: {field: [recommendation, ...]}"""
+    fired = evaluate_weather_rules(readings, rule_table)
+    if min_severity is not None:
+        fired = fired[fired["severity"] >= min_severity]
+    grouped = {}
+    for recommendation in render_recommendations(fired):
+        grouped.setdefault(recommendation["field"], []).append(recommendation)
+    return grouped
+
+def benchmark_weather_rules(num_fields=10000, repeats=5, seed=0):
+    """Time rule evaluation over randomly generated readings for num_fields fields"""
+    rng = np.random.default_rng(seed)
+    readings = pd.DataFrame(
+        {
+            "temperature": rng.normal(20, 10, num_fields),
+            "humidity": rng.uniform(10, 100, num_fields),
+            "rainfall": rng.exponential(5, num_fields)
+        },
+        index=pd.Index([f"field-{i}" for i in range(num_fields)], name="field")
+    )
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fired = evaluate_weather_rules(readings)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "fields": num_fields,
+        "recommendations": len(fired),
+        "best_ms": min(timings) * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000
+    }
+
+if __name__ == "__main__":
+    for size in (100, 1000, 10000):
+        result = benchmark_weather_rules(size)
+        print(f"{result['fields']:>6} fields: {result['recommendations']:>6} recommendations, "
+              f"best {result['best_ms']:.2f} ms, mean {result['mean_ms']:.2f} ms")
@@ -1,72 +1,304 @@
 import requests
 import streamlit as st
+import pandas as pd
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from weather_rules import evaluate_weather_rules, recommendations_by_field, render_recommendations
+
+# Provider selection: "fixture" serves local data, "http" queries Open-Meteo
+WEATHER_PROVIDER = os.environ.get("WEATHER_PROVIDER", "fixture")
+WEATHER_FIXTURE_FILE = os.environ.get("WEATHER_FIXTURE_FILE", "weather_fixture.json")
+
+# Conditions stay fresh for WEATHER_TTL seconds, then are served stale for up
+# to WEATHER_STALE_TTL more seconds while a background refresh runs
+WEATHER_TTL = 15 * 60
+WEATHER_STALE_TTL = 2 * 60 * 60
+WEATHER_REQUEST_TIMEOUT = 5
+
+# After a failed fetch, a location isn't fetched again for WEATHER_FAILURE_TTL
+# seconds, doubling with each consecutive failure up to WEATHER_FAILURE_MAX_TTL
+WEATHER_FAILURE_TTL = 60
+WEATHER_FAILURE_MAX_TTL = 15 * 60
+
+# Locations kept in the conditions and geocoding caches (least recently used are dropped)
+WEATHER_CACHE_SIZE = 1024
+
+# Mock weather data used by the fixture provider and as a last-resort fallback
+DEFAULT_WEATHER_CONDITIONS = {
+    "temperature": 22,  # Celsius
+    "humidity": 65,     # Percentage
+    "rainfall": 2.5,    # mm in last 24h
+    "wind_speed": 12,   # km/h
+    "uv_index": 6,
+    "forecast": "Partly cloudy with chance of rain"
+}
+
+# WMO weather interpretation codes used by Open-Meteo
+WEATHER_CODE_DESCRIPTIONS = {
+    0: "Clear sky",
+    1: "Mainly clear",
+    2: "Partly cloudy",
+    3: "Overcast",
+    45: "Fog",
+    48: "Depositing rime fog",
+    51: "Light drizzle",
+    53: "Drizzle",
+    55: "Dense drizzle",
+    61: "Light rain",
+    63: "Rain",
+    65: "Heavy rain",
+    71: "Light snow",
+    73: "Snow",
+    75: "Heavy snow",
+    80: "Rain showers",
+    81: "Heavy rain showers",
+    82: "Violent rain showers",
+    95: "Thunderstorm",
+    96: "Thunderstorm with hail",
+    99: "Thunderstorm with heavy hail"
+}
+
+class WeatherProvider:
+    """Source of current weather conditions for a location"""
+    
+    name = "base"
+    
+    def fetch(self, location):
+        """Return a conditions dict (temperature, humidity, rainfall, wind_speed, uv_index, forecast)"""
+        raise NotImplementedError
+
+class FixtureWeatherProvider(WeatherProvider):
+    """Serves conditions from a local JSON file keyed by location, for offline use and tests"""
+    
+    name = "fixture"
+    
+    def __init__(self, path=WEATHER_FIXTURE_FILE):
+        self.path = path
+        self.fixtures = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.fixtures = {key.lower(): value for key, value in json.load(f).items()}
+            except (OSError, ValueError):
+                self.fixtures = {}
+    
+    def fetch(self, location):
+        conditions = self.fixtures.get(location) or self.fixtures.get("default") or {}
+        return {**DEFAULT_WEATHER_CONDITIONS, **conditions}
+
+class HTTPWeatherProvider(WeatherProvider):
+    """Fetches current conditions from the Open-Meteo geocoding and forecast APIs"""
+    
+    name = "http"
+    GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+    FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+    
+    def __init__(self, timeout=WEATHER_REQUEST_TIMEOUT, pool_size=10):
+        self.timeout = timeout
+        # One pooled session per process so fetches reuse keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("https://", adapter)
+        self._coordinates = OrderedDict()
+        self._coordinates_lock = threading.Lock()
+    
+    def _geocode(self, location):
+        """Resolve a place name to (latitude, longitude); places don't move, so cache until evicted"""
+        with self._coordinates_lock:
+            if location in self._coordinates:
+                self._coordinates.move_to_end(location)
+                return self._coordinates[location]
+        
+        # "mumbai,maharashtra" -> search for the first component
+        response = self.session.get(
+            self.GEOCODING_URL,
+            params={"name": location.split(",")[0].strip(), "count": 1},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        results = response.json().get("results")
+        if not results:
+            raise ValueError(f"Unknown location: {location}")
+        coordinates = (results[0]["latitude"], results[0]["longitude"])
+        with self._coordinates_lock:
+            self._coordinates[location] = coordinates
+            while len(self._coordinates) > WEATHER_CACHE_SIZE:
+                self._coordinates.popitem(last=False)
+        return coordinates
+    
+    def fetch(self, location):
+        if location == "default":
+            raise ValueError("No location given")
+        
+        latitude, longitude = self._geocode(location)
+        response = self.session.get(
+            self.FORECAST_URL,
+            params={
+                "latitude": latitude,
+                "longitude": longitude,
+                "current": "temperature_2m,relative_humidity_2m,wind_speed_10m,uv_index,weather_code",
+                "daily": "precipitation_sum",
+                "past_days": 1,
+                "forecast_days": 1,
+                "timezone": "auto"
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        current = data["current"]
+        
+        return {
+            "temperature": round(current["temperature_2m"]),
+            "humidity": round(current["relative_humidity_2m"]),
+            "rainfall": data["daily"]["precipitation_sum"][0] or 0.0,
+            "wind_speed": round(current["wind_speed_10m"]),
+            "uv_index": round(current.get("uv_index") or 0),
+            "forecast": WEATHER_CODE_DESCRIPTIONS.get(current.get("weather_code"), "Unknown")
+        }
+
+WEATHER_PROVIDERS = {
+    "fixture": FixtureWeatherProvider,
+    "http": HTTPWeatherProvider
+}
+
+class WeatherService:
+    """Per-location TTL cache in front of a provider
+    
+    Concurrent requests for the same location share a single fetch. Entries past
+    their TTL are served stale while one background refresh runs. If a fetch
+    fails, the last known conditions (or the fallback provider's) are returned,
+    and the location isn't fetched again until its failure backoff has passed.
+    """
+    
+    def __init__(self, provider, ttl=WEATHER_TTL, stale_ttl=WEATHER_STALE_TTL, fallback=None,
+                 max_locations=WEATHER_CACHE_SIZE):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fallback = fallback or FixtureWeatherProvider()
+        self.max_locations = max_locations
+        self._cache = OrderedDict()  # location -> (conditions, fetched_at), least recently used first
+        self._failures = {}          # location -> (retry_at, consecutive failures)
+        self._in_flight = {}         # location -> Future
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-refresh")
+    
+    def _fetch(self, location, future):
+        """Run one provider fetch and publish its result to every waiter"""
+        try:
+            conditions = self.provider.fetch(location)
+            with self._lock:
+                self._cache[location] = (conditions, time.monotonic())
+                self._cache.move_to_end(location)
+                while len(self._cache) > self.max_locations:
+                    self._cache.popitem(last=False)
+                self._failures.pop(location, None)
+            future.set_result(conditions)
+        except Exception as e:
+            with self._lock:
+                _, failures = self._failures.get(location, (0.0, 0))
+                backoff = min(WEATHER_FAILURE_TTL * 2 ** failures, WEATHER_FAILURE_MAX_TTL)
+                self._failures[location] = (time.monotonic() + backoff, failures + 1)
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(location, None)
+    
+    def _start_fetch(self, location, background):
+        """Return the in-flight fetch for location, starting one if needed (call with lock held)"""
+        future = self._in_flight.get(location)
+        if future is not None:
+            return future, False
+        future = Future()
+        self._in_flight[location] = future
+        if background:
+            self._refresher.submit(self._fetch, location, future)
+        return future, True
+    
+    def get(self, location=None):
+        """Current conditions for location, served from cache when possible"""
+        location = (location or "default").strip().lower() or "default"
+        now = time.monotonic()
+        
+        with self._lock:
+            cached = self._cache.get(location)
+            failure = self._failures.get(location)
+            backing_off = failure is not None and now < failure[0]
+            if cached is not None:
+                self._cache.move_to_end(location)
+                conditions, fetched_at = cached
+                age = now - fetched_at
+                if age < self.ttl:
+                    return conditions
+                if age < self.ttl + self.stale_ttl:
+                    # Stale-while-revalidate
+                    if not backing_off:
+                        self._start_fetch(location, background=True)
+                    return conditions
+            if backing_off:
+                # The provider just failed for this location; don't block on it again yet
+                return cached[0] if cached is not None else self.fallback.fetch(location)
+            future, owner = self._start_fetch(location, background=False)
+        
+        if owner:
+            self._fetch(location, future)
+        
+        try:
+            return future.result(timeout=WEATHER_REQUEST_TIMEOUT * 3)
+        except Exception:
+            if cached is not None:
+                return cached[0]
+            return self.fallback.fetch(location)
+    
+    def invalidate(self, location=None):
+        """Drop cached conditions for one location, or for all of them"""
+        with self._lock:
+            if location is None:
+                self._cache.clear()
+                self._failures.clear()
+            else:
+                self._cache.pop(location.strip().lower(), None)
+                self._failures.pop(location.strip().lower(), None)
+
+_weather_service = None
+_weather_service_lock = threading.Lock()
+
+def get_weather_service():
+    """Process-wide weather service shared by all sessions"""
+    global _weather_service
+    if _weather_service is None:
+        with _weather_service_lock:
+            if _weather_service is None:
+                provider_class = WEATHER_PROVIDERS.get(WEATHER_PROVIDER, FixtureWeatherProvider)
+                _weather_service = WeatherService(provider_class())
+    return _weather_service
 
 def get_weather_recommendations(location=None):
     """Get weather-based plant care recommendations"""
     
-    # Mock weather data for demonstration (in production, you'd use a real weather API)
-    weather_conditions = {
-        "temperature": 22,  # Celsius
-        "humidity": 65,     # Percentage
-        "rainfall": 2.5,    # mm in last 24h
-        "wind_speed": 12,   # km/h
-        "uv_index": 6,
-        "forecast": "Partly cloudy with chance of rain"
-    }
+    weather_conditions = get_weather_service().get(location)
     
-    recommendations = []
-    
-    # Temperature-based recommendations
-    if weather_conditions["temperature"] > 30:
-        recommendations.append({
-            "type": "warning",
-            "icon": "🌡️",
-            "title": "High Temperature Alert",
-            "message": "Increase watering frequency and provide shade for sensitive plants. Monitor for heat stress."
-        })
-    elif weather_conditions["temperature"] < 5:
-        recommendations.append({
-            "type": "warning", 
-            "icon": "❄️",
-            "title": "Cold Weather Alert",
-            "message": "Protect plants from frost. Move potted plants indoors if possible."
-        })
-    
-    # Humidity recommendations
-    if weather_conditions["humidity"] > 80:
-        recommendations.append({
-            "type": "info",
-            "icon": "💧",
-            "title": "High Humidity",
-            "message": "Watch for fungal diseases. Ensure good air circulation around plants."
-        })
-    elif weather_conditions["humidity"] < 30:
-        recommendations.append({
-            "type": "info",
-            "icon": "🏜️", 
-            "title": "Low Humidity",
-            "message": "Consider misting plants or using humidity trays for moisture-loving species."
-        })
-    
-    # Rainfall recommendations
-    if weather_conditions["rainfall"] > 20:
-        recommendations.append({
-            "type": "warning",
-            "icon": "☔",
-            "title": "Heavy Rainfall",
-            "message": "Check for waterlogged soil and ensure proper drainage. Watch for root rot signs."
-        })
-    elif weather_conditions["rainfall"] < 0.5:
-        recommendations.append({
-            "type": "info",
-            "icon": "☀️",
-            "title": "Dry Conditions", 
-            "message": "Increase watering frequency. Check soil moisture regularly."
-        })
+    # Evaluate the rule table over a single-field frame
+    readings = pd.DataFrame([weather_conditions], index=pd.Index([location or "default"], name="field"))
+    recommendations = render_recommendations(evaluate_weather_rules(readings))
     
     return weather_conditions, recommendations
 
+def get_field_weather_recommendations(field_readings, min_severity=None):
+    """Get recommendations for many fields at once from per-field microclimate readings
+    
+    field_readings is a DataFrame indexed by field with temperature, humidity
+    and rainfall columns. Returns {field: [recommendation, ...]}.
+    """
+    return recommendations_by_field(field_readings, min_severity=min_severity)
+
 def get_seasonal_tips():
     """Get seasonal plant care tips"""
     